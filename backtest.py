@@ -0,0 +1,263 @@
+# backtest.py
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from dotenv import load_dotenv
+from batch_indicators import percent_k_series, percent_d_series, ema_series, calculate_macd_batch
+from candle_store import CandleStore
+from candles import Candles
+from config import load_settings
+from rules import RulePlan, compile_rules, default_gate, default_rules
+
+# Количество закрытых свечей, по которым бот считает индикаторы (KLINE_LIMIT - 1 в main.py)
+HISTORY = 35
+DEFAULT_HORIZONS = (1, 4, 16)
+
+def default_params() -> dict:
+    """
+    Параметры стратегии из настроек бота (переменные окружения, как в main.py).
+    """
+    settings = load_settings(require_telegram=False)
+    return {
+        'k_period': settings.k_period,
+        'd_period': settings.d_period,
+        'fast_period': settings.fast_period,
+        'slow_period': settings.slow_period,
+        'signal_period': settings.signal_period,
+        'overbought': settings.overbought,
+        'oversold': settings.oversold,
+        'max_percent_k': settings.max_percent_k,
+        'min_macd': settings.min_macd,
+        'signal_gate': settings.signal_gate,
+        'signal_rules': settings.signal_rules,
+    }
+
+def rule_plan(params: dict) -> RulePlan:
+    """
+    План проверки набора параметров: SIGNAL_GATE и SIGNAL_RULES, а при их
+    отсутствии — правила по порогам набора (как get_rule_plan в боте).
+    """
+    thresholds = SimpleNamespace(**params)
+    return compile_rules(params.get('signal_gate') or default_gate(thresholds),
+                         params.get('signal_rules') or default_rules(thresholds))
+
+def load_csv_dir(path: str) -> Dict[str, Candles]:
+    """
+    Загружает свечи из каталога CSV-файлов вида SYMBOL.csv
+    с колонками start, open, high, low, close, volume (от старых к новым).
+    """
+    candles_by_symbol = {}
+    for name in sorted(os.listdir(path)):
+        if not name.endswith('.csv'):
+            continue
+        with open(os.path.join(path, name), newline='') as f:
+            reader = csv.DictReader(f)
+            candles_by_symbol[name[:-4]] = Candles.from_rows(
+                (row['start'], row['open'], row['high'], row['low'], row['close'], row['volume'])
+                for row in reader
+            )
+    return candles_by_symbol
+
+def load_store(path: str, interval: str, limit: int) -> Dict[str, Candles]:
+    """
+    Загружает свечи всех символов интервала из локального хранилища CandleStore.
+    """
+    store = CandleStore(path, max_history=limit)
+    try:
+        return {
+            symbol: Candles.from_rows(store.load(symbol, interval, limit))
+            for symbol in store.symbols(interval)
+        }
+    finally:
+        store.close()
+
+def cached(cache: dict, key: tuple, compute):
+    """
+    Возвращает значение из кэша промежуточных результатов, вычисляя его при отсутствии.
+    """
+    if cache is None:
+        return compute()
+    if key not in cache:
+        cache[key] = compute()
+    return cache[key]
+
+def compute_signals(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray, params: dict,
+                    history: int = HISTORY, cache: dict = None) -> np.ndarray:
+    """
+    Повторяет логику бота свеча за свечой: для каждой закрытой свечи индикаторы
+    считаются по последним `history` свечам, как в analyze_candles, затем применяются
+    фильтр и правила сигналов (SIGNAL_GATE и SIGNAL_RULES или пороги набора).
+
+    :param cache: Кэш промежуточных рядов (%K по k_period, EMA по периоду и окну),
+                  общий для наборов параметров одного символа.
+    :return: Массив сигналов по свечам: 1 — long, -1 — short, 0 — нет сигнала.
+    """
+    length = len(closes)
+    signals = np.zeros(length, dtype=np.int8)
+    k_period, d_period = params['k_period'], params['d_period']
+    fast_period, slow_period, signal_period = params['fast_period'], params['slow_period'], params['signal_period']
+    window = max(history, slow_period + signal_period)
+    if length < window:
+        return signals
+
+    # MACD в боте считается заново по окну свечей — каждое окно как отдельный «символ»
+    windows = cached(cache, ('windows', window), lambda: sliding_window_view(closes, window))
+
+    def compute(name: str) -> np.ndarray:
+        if name in ('%K', '%D'):
+            percent_k = cached(cache, ('%K', k_period),
+                               lambda: percent_k_series(highs[None, :], lows[None, :], closes[None, :], k_period))
+            if name == '%K':
+                return percent_k[0, window - 1:]
+            percent_d = cached(cache, ('%D', k_period, d_period),
+                               lambda: percent_d_series(percent_k, k_period, d_period))
+            return percent_d[0, window - 1:]
+        if name == 'MACD':
+            # Для MACD достаточно последних значений быстрой и медленной EMA каждого окна
+            ema_fast = cached(cache, ('EMA', fast_period, window), lambda: ema_series(windows, fast_period)[:, -1])
+            ema_slow = cached(cache, ('EMA', slow_period, window), lambda: ema_series(windows, slow_period)[:, -1])
+            return ema_fast - ema_slow
+        macd, signal, histogram = cached(cache, ('MACD', fast_period, slow_period, signal_period, window),
+                                         lambda: calculate_macd_batch(windows, fast_period, slow_period, signal_period))
+        return signal if name == 'Signal' else histogram
+
+    series = {}
+
+    def load(name: str, rows: np.ndarray) -> np.ndarray:
+        if name not in series:
+            series[name] = compute(name)
+        return series[name][rows]
+
+    _, names = rule_plan(params).evaluate_arrays(length - window + 1, load)
+    signals[window - 1:] = np.where(names == 'long', 1, np.where(names == 'short', -1, 0))
+    return signals
+
+def forward_returns(closes: np.ndarray, horizon: int) -> np.ndarray:
+    """
+    Доходность от закрытия свечи до закрытия через `horizon` свечей (NaN в конце ряда).
+    """
+    returns = np.full(len(closes), np.nan)
+    if horizon < len(closes):
+        returns[:-horizon] = closes[horizon:] / closes[:-horizon] - 1
+    return returns
+
+def empty_stats(horizons: Sequence[int]) -> dict:
+    return {
+        'long': 0,
+        'short': 0,
+        'returns': {horizon: [0.0, 0, 0] for horizon in horizons},  # сумма, количество, прибыльных
+    }
+
+def evaluate_symbol(task: Tuple[np.ndarray, np.ndarray, np.ndarray, List[dict], Sequence[int], int]) -> List[dict]:
+    """
+    Прогоняет все наборы параметров по одному символу (выполняется в отдельном процессе).
+    """
+    highs, lows, closes, param_sets, horizons, history = task
+    returns = {horizon: forward_returns(closes, horizon) for horizon in horizons}
+    cache = {}
+    results = []
+    for params in param_sets:
+        signals = compute_signals(highs, lows, closes, params, history, cache)
+        stats = empty_stats(horizons)
+        stats['long'] = int((signals == 1).sum())
+        stats['short'] = int((signals == -1).sum())
+        fired = signals != 0
+        for horizon in horizons:
+            # Для short прибыль — падение цены
+            signal_returns = returns[horizon][fired] * signals[fired]
+            signal_returns = signal_returns[~np.isnan(signal_returns)]
+            stats['returns'][horizon] = [float(signal_returns.sum()), len(signal_returns), int((signal_returns > 0).sum())]
+        results.append(stats)
+    return results
+
+def merge_stats(total: dict, stats: dict):
+    total['long'] += stats['long']
+    total['short'] += stats['short']
+    for horizon, (value, count, hits) in stats['returns'].items():
+        total['returns'][horizon][0] += value
+        total['returns'][horizon][1] += count
+        total['returns'][horizon][2] += hits
+
+def run_backtest(candles_by_symbol: Dict[str, Candles], param_sets: List[dict],
+                 horizons: Sequence[int] = DEFAULT_HORIZONS, history: int = HISTORY,
+                 workers: int = None) -> List[dict]:
+    """
+    Запускает бэктест всех наборов параметров по всем символам в пуле процессов.
+
+    :return: Сводка по каждому набору параметров: количество сигналов,
+             средняя доходность и доля прибыльных сигналов по горизонтам.
+    """
+    tasks = [
+        (np.asarray(candles.high), np.asarray(candles.low), np.asarray(candles.close), param_sets, horizons, history)
+        for candles in candles_by_symbol.values()
+    ]
+    totals = [empty_stats(horizons) for _ in param_sets]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for symbol_results in executor.map(evaluate_symbol, tasks, chunksize=max(1, len(tasks) // 64)):
+            for total, stats in zip(totals, symbol_results):
+                merge_stats(total, stats)
+
+    report = []
+    for params, total in zip(param_sets, totals):
+        row = dict(params, signals=total['long'] + total['short'], long=total['long'], short=total['short'])
+        for horizon, (value, count, hits) in total['returns'].items():
+            row[f'mean_ret_{horizon}'] = value / count if count else float('nan')
+            row[f'hit_rate_{horizon}'] = hits / count if count else float('nan')
+        report.append(row)
+    return report
+
+def format_table(rows: List[dict]) -> str:
+    if not rows:
+        return ""
+    columns = list(rows[0])
+    cells = [[f"{row[column]:.5f}" if isinstance(row[column], float) else str(row[column]) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+    lines = [" | ".join(column.rjust(width) for column, width in zip(columns, widths))]
+    lines.append("-+-".join("-" * width for width in widths))
+    lines.extend(" | ".join(cell.rjust(width) for cell, width in zip(line, widths)) for line in cells)
+    return "\n".join(lines)
+
+def write_csv(rows: List[dict], path: str):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+def load_candles(args) -> Dict[str, Candles]:
+    if args.csv_dir:
+        return load_csv_dir(args.csv_dir)
+    return load_store(args.store, args.interval, args.limit)
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Бэктест сигналов Стохастика и MACD на сохранённых свечах.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--csv-dir', help="Каталог CSV-файлов SYMBOL.csv")
+    source.add_argument('--store', help="Файл хранилища свечей (SQLite)")
+    parser.add_argument('--interval', default='15', help="Интервал свечей в хранилище")
+    parser.add_argument('--limit', type=int, default=35_040, help="Максимум свечей на символ из хранилища")
+    parser.add_argument('--params', help="JSON-файл со списком наборов параметров")
+    parser.add_argument('--horizons', default=",".join(map(str, DEFAULT_HORIZONS)), help="Горизонты доходности в свечах")
+    parser.add_argument('--workers', type=int, default=None, help="Количество процессов")
+    parser.add_argument('--output', help="Сохранить результаты в CSV")
+    args = parser.parse_args()
+
+    param_sets = [default_params()]
+    if args.params:
+        with open(args.params) as f:
+            param_sets = [dict(default_params(), **params) for params in json.load(f)]
+    horizons = [int(horizon) for horizon in args.horizons.split(',')]
+
+    rows = run_backtest(load_candles(args), param_sets, horizons, workers=args.workers)
+    print(format_table(rows))
+    if args.output and rows:
+        write_csv(rows, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# batch_indicators.py
+from typing import List, Tuple
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from candles import Candles
+
+def stack_candles(candle_lists: List[Candles]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Собирает свечи нескольких символов в 2-D массивы (символы × свечи).
+
+    Все ряды выравниваются по последним свечам и обрезаются до длины самого короткого ряда.
+
+    :param candle_lists: Свечи (от старых к новым) для каждого символа.
+    :return: Массивы high, low, close формы (символы, свечи).
+    """
+    length = min((len(candles) for candles in candle_lists), default=0)
+    shape = (len(candle_lists), length)
+    highs = np.empty(shape)
+    lows = np.empty(shape)
+    closes = np.empty(shape)
+    if length == 0:
+        return highs, lows, closes
+
+    for row, candles in enumerate(candle_lists):
+        highs[row] = np.frombuffer(candles.high, dtype=np.float64)[-length:]
+        lows[row] = np.frombuffer(candles.low, dtype=np.float64)[-length:]
+        closes[row] = np.frombuffer(candles.close, dtype=np.float64)[-length:]
+    return highs, lows, closes
+
+def ema_series(data: np.ndarray, period: int, start: int = 0) -> np.ndarray:
+    """
+    Рассчитывает EMA по оси свечей для всех символов сразу.
+
+    Первое значение — SMA первых `period` значений начиная с индекса `start`,
+    как в calculate_macd.
+
+    :param data: Массив формы (символы, свечи).
+    :param period: Период EMA.
+    :param start: Индекс первого значимого значения в ряду.
+    :return: Массив EMA той же формы, NaN там, где EMA не определена.
+    """
+    ema = np.full(data.shape, np.nan)
+    seed = start + period - 1
+    if seed >= data.shape[1]:
+        return ema
+
+    multiplier = 2 / (period + 1)
+    ema[:, seed] = data[:, start:seed + 1].mean(axis=1)
+    for i in range(seed + 1, data.shape[1]):
+        ema[:, i] = (data[:, i] - ema[:, i - 1]) * multiplier + ema[:, i - 1]
+    return ema
+
+def percent_k_series(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray, k_period: int = 14) -> np.ndarray:
+    """
+    Рассчитывает ряд %K без сглаживания для всех символов сразу.
+
+    :return: Ряд %K формы (символы, свечи), NaN там, где значения не определены.
+    """
+    percent_k = np.full(closes.shape, np.nan)
+    if closes.shape[1] < k_period:
+        return percent_k
+
+    highest_high = sliding_window_view(highs, k_period, axis=1).max(axis=2)
+    lowest_low = sliding_window_view(lows, k_period, axis=1).min(axis=2)
+    price_range = highest_high - lowest_low
+    with np.errstate(divide='ignore', invalid='ignore'):
+        raw_k = (closes[:, k_period - 1:] - lowest_low) / price_range * 100
+    # При нулевом диапазоне %K = 0, как в calculate_stochastic_oscillator
+    raw_k[price_range == 0] = 0
+    percent_k[:, k_period - 1:] = raw_k
+    return percent_k
+
+def percent_d_series(percent_k: np.ndarray, k_period: int = 14, d_period: int = 3) -> np.ndarray:
+    """
+    Рассчитывает ряд %D как скользящее среднее ряда %K.
+
+    :param percent_k: Ряд %K из percent_k_series.
+    :return: Ряд %D той же формы, NaN там, где значения не определены.
+    """
+    percent_d = np.full(percent_k.shape, np.nan)
+    raw_k = percent_k[:, k_period - 1:]
+    if raw_k.shape[1] >= d_period:
+        percent_d[:, k_period + d_period - 2:] = sliding_window_view(raw_k, d_period, axis=1).mean(axis=2)
+    return percent_d
+
+def stochastic_series(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray,
+                      k_period: int = 14, d_period: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Рассчитывает ряды %K и %D для всех символов сразу.
+
+    :param highs: Максимумы формы (символы, свечи).
+    :param lows: Минимумы формы (символы, свечи).
+    :param closes: Цены закрытия формы (символы, свечи).
+    :param k_period: Период для расчёта %K.
+    :param d_period: Период для расчёта %D.
+    :return: Ряды %K и %D той же формы, NaN там, где значения не определены.
+    """
+    percent_k = percent_k_series(highs, lows, closes, k_period)
+    return percent_k, percent_d_series(percent_k, k_period, d_period)
+
+def macd_series(closes: np.ndarray, fast_period: int = 12, slow_period: int = 26,
+                signal_period: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Рассчитывает ряды MACD, сигнальной линии и гистограммы для всех символов сразу.
+
+    :param closes: Цены закрытия формы (символы, свечи).
+    :param fast_period: Период быстрой EMA.
+    :param slow_period: Период медленной EMA.
+    :param signal_period: Период сигнальной линии.
+    :return: Ряды MACD, сигнальной линии и гистограммы той же формы.
+    """
+    macd_line = ema_series(closes, fast_period) - ema_series(closes, slow_period)
+    first_valid = max(fast_period, slow_period) - 1
+    signal_line = ema_series(macd_line, signal_period, start=first_valid)
+    return macd_line, signal_line, macd_line - signal_line
+
+def calculate_stochastic_oscillator_batch(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray,
+                                          k_period: int = 14, d_period: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Пакетный аналог calculate_stochastic_oscillator.
+
+    :return: Последние значения %K и %D для каждого символа (NaN при нехватке данных).
+    """
+    if closes.shape[1] < k_period + d_period - 1:
+        nan = np.full(closes.shape[0], np.nan)
+        return nan, nan.copy()
+
+    # Для последних значений достаточно хвоста длиной k_period + d_period - 1
+    tail = k_period + d_period - 1
+    percent_k, percent_d = stochastic_series(highs[:, -tail:], lows[:, -tail:], closes[:, -tail:], k_period, d_period)
+    return percent_k[:, -1], percent_d[:, -1]
+
+def calculate_macd_batch(closes: np.ndarray, fast_period: int = 12, slow_period: int = 26,
+                         signal_period: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Пакетный аналог calculate_macd.
+
+    :return: Последние значения MACD, сигнальной линии и гистограммы для каждого символа (NaN при нехватке данных).
+    """
+    if closes.shape[1] < slow_period + signal_period:
+        nan = np.full(closes.shape[0], np.nan)
+        return nan, nan.copy(), nan.copy()
+
+    macd_line, signal_line, histogram = macd_series(closes, fast_period, slow_period, signal_period)
+    return macd_line[:, -1], signal_line[:, -1], histogram[:, -1]
@@ -0,0 +1,474 @@
+# benchmark.py
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional, Sequence
+import numpy as np
+from aiohttp import web
+from dotenv import load_dotenv
+from backtest import format_table, load_csv_dir, load_store
+from candles import Candles
+from config import load_settings
+
+DEFAULT_SIZES = (100, 500, 5000)
+DEFAULT_INTERVAL = '15'
+BENCHMARK_TOKEN = '0:benchmark'
+BENCHMARK_CHAT_ID = '1'
+
+def synthetic_rows(seed: int, count: int, interval_ms: int, end: Optional[int] = None) -> List[list]:
+    """
+    Генерирует свечи случайного блуждания в формате REST Bybit (от старых к новым, строки).
+    Последняя свеча — текущая незакрытая.
+
+    :param seed: Зерно генератора (одинаковое зерно — одинаковые свечи).
+    :param count: Количество свечей.
+    :param interval_ms: Длительность свечи, мс.
+    :param end: Время открытия последней свечи, мс (по умолчанию текущая свеча).
+    """
+    rng = random.Random(seed)
+    if end is None:
+        end = int(time.time() * 1000) // interval_ms * interval_ms
+    price = rng.uniform(0.01, 50_000)
+    rows = []
+    for i in range(count):
+        open_price = price
+        price *= 1 + rng.gauss(0, 0.004)
+        high = max(open_price, price) * (1 + abs(rng.gauss(0, 0.002)))
+        low = min(open_price, price) * (1 - abs(rng.gauss(0, 0.002)))
+        volume = rng.uniform(10, 10_000)
+        rows.append([
+            str(end - (count - 1 - i) * interval_ms), f"{open_price:.8g}", f"{high:.8g}", f"{low:.8g}",
+            f"{price:.8g}", f"{volume:.4f}", f"{volume * price:.4f}",
+        ])
+    return rows
+
+def candles_to_rows(candles: Candles) -> List[list]:
+    """
+    Переводит свечи в строки формата REST Bybit.
+    """
+    return [
+        [str(candles.start[i]), str(candles.open[i]), str(candles.high[i]), str(candles.low[i]),
+         str(candles.close[i]), str(candles.volume[i]), '0']
+        for i in range(len(candles))
+    ]
+
+class Fixtures:
+    """
+    Свечи для бенчмарка: синтетические или записанные (CSV-каталог / хранилище свечей).
+    Записанные ряды раздаются символам по кругу, поэтому их может быть меньше, чем символов.
+    """
+
+    def __init__(self, recorded: Optional[Dict[str, Candles]] = None, seed: int = 0):
+        self.recorded = [candles_to_rows(candles) for candles in (recorded or {}).values() if len(candles)]
+        self.seed = seed
+
+    def symbols(self, count: int) -> List[str]:
+        return [f"BENCH{i:05d}USDT" for i in range(count)]
+
+    def rows(self, symbol: str, interval_ms: int, limit: int) -> List[list]:
+        """
+        Возвращает последние `limit` свечей символа (от старых к новым).
+        """
+        index = int(symbol[5:10]) if symbol.startswith('BENCH') else sum(map(ord, symbol))
+        if self.recorded:
+            return self.recorded[index % len(self.recorded)][-limit:]
+        return synthetic_rows(self.seed * 1_000_003 + index, limit, interval_ms)
+
+class MockServer:
+    """
+    Локальный сервер, отвечающий как Bybit (kline, instruments-info, tickers) и Telegram Bot API (sendMessage).
+    """
+
+    def __init__(self, fixtures: Fixtures, symbols: Sequence[str], latency: float = 0.0):
+        """
+        :param fixtures: Источник свечей.
+        :param symbols: Символы, возвращаемые в списке инструментов.
+        :param latency: Искусственная задержка ответа, сек.
+        """
+        self.fixtures = fixtures
+        self.symbols = list(symbols)
+        self.latency = latency
+        self.kline_requests = 0
+        self.messages = []
+        self.runner = None
+        self.port = None
+
+    async def _delay(self):
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+    async def kline(self, request: web.Request) -> web.Response:
+        from bybit_api import INTERVAL_MS
+
+        await self._delay()
+        self.kline_requests += 1
+        query = request.query
+        rows = self.fixtures.rows(query['symbol'], INTERVAL_MS[query['interval']], int(query.get('limit', 200)))
+        return web.json_response({"retCode": 0, "retMsg": "OK", "result": {"list": rows[::-1]}})
+
+    async def instruments(self, request: web.Request) -> web.Response:
+        await self._delay()
+        instruments = [
+            {"symbol": symbol, "contractType": "LinearPerpetual", "settleCoin": "USDT", "status": "Trading"}
+            for symbol in self.symbols
+        ]
+        return web.json_response({"retCode": 0, "retMsg": "OK", "result": {"list": instruments, "nextPageCursor": ""}})
+
+    async def tickers(self, request: web.Request) -> web.Response:
+        from bybit_api import INTERVAL_MS
+
+        await self._delay()
+        tickers = []
+        for symbol in self.symbols:
+            rows = self.fixtures.rows(symbol, INTERVAL_MS['15'], 96)
+            tickers.append({
+                "symbol": symbol,
+                "lastPrice": rows[-1][4],
+                "highPrice24h": str(max(float(row[2]) for row in rows)),
+                "lowPrice24h": str(min(float(row[3]) for row in rows)),
+                "turnover24h": str(sum(float(row[6]) for row in rows)),
+                "volume24h": str(sum(float(row[5]) for row in rows)),
+            })
+        return web.json_response({"retCode": 0, "retMsg": "OK", "result": {"category": "linear", "list": tickers}})
+
+    async def get_me(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "ok": True,
+            "result": {"id": 1, "is_bot": True, "first_name": "benchmark", "username": "benchmark_bot"},
+        })
+
+    async def telegram(self, request: web.Request) -> web.Response:
+        await self._delay()
+        data = await request.post() if request.content_type != 'application/json' else await request.json()
+        self.messages.append(data.get('text', ''))
+        return web.json_response({
+            "ok": True,
+            "result": {
+                "message_id": len(self.messages),
+                "date": int(time.time()),
+                "chat": {"id": int(data.get('chat_id', BENCHMARK_CHAT_ID)), "type": "private"},
+                "text": data.get('text', ''),
+            },
+        })
+
+    async def start(self) -> str:
+        """
+        Запускает сервер на свободном порту.
+
+        :return: Базовый адрес сервера.
+        """
+        app = web.Application()
+        app.router.add_get('/v5/market/kline', self.kline)
+        app.router.add_get('/v5/market/instruments-info', self.instruments)
+        app.router.add_get('/v5/market/tickers', self.tickers)
+        app.router.add_post('/bot{token}/getMe', self.get_me)
+        app.router.add_post('/bot{token}/sendMessage', self.telegram)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{self.port}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+def summarize(samples: Sequence[float], items: int = 1) -> dict:
+    """
+    Сводка по замерам: перцентили времени одного замера (мс) и пропускная способность.
+
+    :param samples: Длительности замеров, сек.
+    :param items: Количество обработанных элементов за один замер.
+    """
+    values = np.asarray(samples, dtype=float) * 1000
+    total = float(np.sum(samples))
+    return {
+        'runs': len(values),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p90_ms': float(np.percentile(values, 90)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max()),
+        'per_sec': len(values) * items / total if total > 0 else float('inf'),
+    }
+
+def measure(function: Callable, arguments: Sequence[tuple], repeat: int) -> List[float]:
+    """
+    Замеряет время каждого вызова function(*args) по всем наборам аргументов `repeat` раз.
+    """
+    samples = []
+    timer = time.perf_counter
+    for _ in range(repeat):
+        for args in arguments:
+            started = timer()
+            function(*args)
+            samples.append(timer() - started)
+    return samples
+
+def run_micro(fixtures: Fixtures, symbols: int, repeat: int) -> Dict[str, dict]:
+    """
+    Замеряет отдельные этапы анализа одного символа: разбор строк свечей, декодирование
+    ответа Bybit в колонки, индикаторы, analyze_candles, проверку плана правил,
+    экранирование сообщения, а также пакетный анализ всех символов.
+    """
+    from batch_indicators import stack_candles
+    from bybit_api import INTERVAL_MS, json_loads
+    from helpers import analyze_candles, analyze_candles_batch
+    from macd import calculate_macd
+    from rules import get_rule_plan
+    from stochastic_oscillator import calculate_stochastic_oscillator
+    from utils import escape_markdown
+
+    settings = load_settings(require_telegram=False)
+    limit = settings.kline_limit
+    rows = [fixtures.rows(symbol, INTERVAL_MS[DEFAULT_INTERVAL], limit)[:-1] for symbol in fixtures.symbols(symbols)]
+    candles = [Candles.from_rows(symbol_rows) for symbol_rows in rows]
+    payloads = [
+        json.dumps({"retCode": 0, "retMsg": "OK", "result": {"list": symbol_rows[::-1]}}).encode()
+        for symbol_rows in rows
+    ]
+    message = (
+        "🔥 #BENCH00000USDT\n🕒 15m, 1h\n🟢 LONG\n"
+        "%K: 4.12345\n%D: 6.54321\nMACD: 0.0012345\n"
+    )
+    highs, lows, closes = stack_candles(candles)
+    rule_plan = get_rule_plan(settings)
+
+    stages = {
+        'parse': measure(Candles.from_rows, [(symbol_rows,) for symbol_rows in rows], repeat),
+        'decode': measure(lambda body: Candles.from_bybit_list(json_loads(body)['result']['list']),
+                          [(body,) for body in payloads], repeat),
+        'stochastic': measure(calculate_stochastic_oscillator,
+                              [(item, settings.k_period, settings.d_period) for item in candles], repeat),
+        'macd': measure(calculate_macd,
+                        [(item, settings.fast_period, settings.slow_period, settings.signal_period) for item in candles], repeat),
+        'analyze': measure(analyze_candles, [(item, settings) for item in candles], repeat),
+        'rules': measure(rule_plan.evaluate, [(item, settings) for item in candles], repeat),
+        'escape': measure(escape_markdown, [(message,)] * len(candles), repeat),
+    }
+    report = {stage: summarize(samples) for stage, samples in stages.items()}
+    report['analyze_batch'] = summarize(
+        measure(analyze_candles_batch, [(highs, lows, closes, settings)], repeat), items=len(candles)
+    )
+    report['rules_batch'] = summarize(
+        measure(rule_plan.evaluate_batch, [(highs, lows, closes, settings)], repeat), items=len(candles)
+    )
+    return report
+
+async def run_pipeline(fixtures: Fixtures, size: int, cycles: int, latency: float,
+                       bybit_rate: Optional[float], processes: int = 1) -> dict:
+    """
+    Прогоняет полный цикл сканирования (run_cycle) для `size` символов через локальный
+    сервер Bybit/Telegram и собирает замеры этапов цикла из metrics.
+
+    :param processes: Количество процессов сканирования (SCAN_PROCESSES).
+    """
+    # main читает настройки при импорте; данные бенчмарка не должны уходить в реальный чат
+    os.environ.setdefault('BOT_TOKEN', BENCHMARK_TOKEN)
+    os.environ.setdefault('CHAT_ID', BENCHMARK_CHAT_ID)
+    # Повторные циклы по тем же свечам не должны отсеиваться как повторы сигналов
+    os.environ.setdefault('SIGNAL_STATE', '')
+    import bybit_api
+    import main
+    from metrics import metrics
+    from telegram import Bot
+
+    symbols = fixtures.symbols(size)
+    server = MockServer(fixtures, symbols, latency)
+    base_url = await server.start()
+
+    # Процессы сканирования получают адрес сервера и лимиты через окружение
+    worker_env = {
+        'BYBIT_API_URL': f"{base_url}/v5/market/",
+        'BYBIT_RATE_LIMIT': str(bybit_rate or 1e9),
+        'BYBIT_RATE_BURST': str(int(bybit_rate or 1e9)),
+        'CANDLE_STORE': '',
+        'SIGNAL_STATE': '',
+    }
+    saved_env = {name: os.environ.get(name) for name in worker_env}
+    os.environ.update(worker_env)
+
+    # Подмена адресов только на время прогона
+    api_base_url = bybit_api.API_BASE_URL
+    rate_limiter = bybit_api.rate_limiter
+    candle_store = main.candle_store
+    signal_state = main.signal_state
+    bybit_api.API_BASE_URL = worker_env['BYBIT_API_URL']
+    bybit_api.rate_limiter = bybit_api.RateLimiter(bybit_rate or 1e9, int(bybit_rate or 1e9))
+    main.candle_store = None
+    main.signal_state = None
+
+    settings = replace(
+        load_settings(require_telegram=False),
+        bot_token=BENCHMARK_TOKEN,
+        chat_id=BENCHMARK_CHAT_ID,
+        intervals={DEFAULT_INTERVAL: '15m'},
+        message_limit=max(1, size),
+        resample_base_interval=None,
+        scan_processes=processes,
+        telegram_rate=1e6,
+        telegram_burst=1_000_000,
+        digest_linger=0.0,
+    )
+    stages = {}
+    bot = Bot(BENCHMARK_TOKEN, base_url=f"{base_url}/bot")
+    session = bybit_api.get_session()
+    try:
+        async with bot:
+            for _ in range(cycles):
+                await main.run_cycle(bot, session, symbols, settings.intervals, settings)
+                for stage, samples in metrics.last_samples.items():
+                    stages.setdefault(stage, []).extend(samples)
+    finally:
+        main.close_shard_pool()
+        bybit_api.API_BASE_URL = api_base_url
+        bybit_api.rate_limiter = rate_limiter
+        main.candle_store = candle_store
+        main.signal_state = signal_state
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        await bybit_api.close_session()
+        await server.stop()
+
+    return {
+        'stages': {
+            stage: summarize(samples, items=size if stage in ('scan', 'cycle') else 1)
+            for stage, samples in stages.items()
+        },
+        'kline_requests': server.kline_requests,
+        'telegram_messages': len(server.messages),
+    }
+
+def flatten(report: dict) -> Dict[str, dict]:
+    """
+    Приводит отчёт к виду {имя этапа: сводка} для таблицы и сравнения с эталоном.
+    """
+    stages = {f"micro.{stage}": stats for stage, stats in report.get('micro', {}).items()}
+    for size, pipeline in report.get('pipeline', {}).items():
+        for stage, stats in pipeline['stages'].items():
+            stages[f"pipeline.{size}.{stage}"] = stats
+    return stages
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[dict]:
+    """
+    Сравнивает медианы этапов с эталоном.
+
+    :param tolerance: Допустимое замедление (0.2 — на 20%).
+    :return: Строки сравнения с отметкой о регрессии.
+    """
+    current, reference = flatten(report), flatten(baseline)
+    rows = []
+    for stage, stats in current.items():
+        if stage not in reference:
+            continue
+        before, after = reference[stage]['p50_ms'], stats['p50_ms']
+        change = after / before - 1 if before > 0 else 0.0
+        rows.append({
+            'stage': stage,
+            'baseline_p50_ms': before,
+            'p50_ms': after,
+            'change': change,
+            'status': 'REGRESSION' if change > tolerance else 'ok',
+        })
+    return rows
+
+async def record_fixtures(path: str, count: int, interval: str, limit: int):
+    """
+    Записывает свечи `count` символов с Bybit в CSV-каталог (формат backtest.load_csv_dir).
+    """
+    from bybit_api import close_session, get_latest_klines, get_session, get_usdt_perpetual_symbols
+
+    os.makedirs(path, exist_ok=True)
+    session = get_session()
+    try:
+        symbols = (await get_usdt_perpetual_symbols(session) or [])[:count]
+        for symbol in symbols:
+            rows = await get_latest_klines(session, symbol, interval, limit)
+            if not rows:
+                continue
+            with open(os.path.join(path, f"{symbol}.csv"), 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['start', 'open', 'high', 'low', 'close', 'volume'])
+                writer.writerows(row[:6] for row in rows[:-1])
+        print(f"Записано символов: {len(symbols)} в {path}")
+    finally:
+        await close_session()
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Бенчмарк индикаторов, разбора свечей и полного цикла сканирования.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--csv-dir', help="Записанные свечи: каталог CSV-файлов SYMBOL.csv")
+    source.add_argument('--store', help="Записанные свечи: файл хранилища свечей (SQLite)")
+    parser.add_argument('--interval', default=DEFAULT_INTERVAL, help="Интервал свечей в хранилище")
+    parser.add_argument('--record', help="Записать свечи с Bybit в CSV-каталог и выйти")
+    parser.add_argument('--record-count', type=int, default=100, help="Количество записываемых символов")
+    parser.add_argument('--sizes', default=",".join(map(str, DEFAULT_SIZES)), help="Количество символов в цикле сканирования")
+    parser.add_argument('--cycles', type=int, default=3, help="Количество циклов на каждый размер")
+    parser.add_argument('--repeat', type=int, default=20, help="Повторы микробенчмарков")
+    parser.add_argument('--micro-symbols', type=int, default=100, help="Количество символов в микробенчмарках")
+    parser.add_argument('--latency', type=float, default=0.0, help="Задержка ответа локального сервера, мс")
+    parser.add_argument('--bybit-rate', type=float, default=None, help="Ограничение запросов к Bybit в секунду (по умолчанию без ограничения)")
+    parser.add_argument('--processes', type=int, default=1, help="Количество процессов сканирования (SCAN_PROCESSES)")
+    parser.add_argument('--seed', type=int, default=0, help="Зерно синтетических свечей")
+    parser.add_argument('--skip-pipeline', action='store_true', help="Только микробенчмарки")
+    parser.add_argument('--output', help="Сохранить отчёт в JSON")
+    parser.add_argument('--save-baseline', help="Сохранить отчёт как эталон")
+    parser.add_argument('--baseline', help="Сравнить с эталоном; при регрессии код возврата 1")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Допустимое замедление медианы относительно эталона")
+    args = parser.parse_args()
+
+    if args.record:
+        asyncio.run(record_fixtures(args.record, args.record_count, args.interval, load_settings(require_telegram=False).kline_limit))
+        return
+
+    recorded = None
+    if args.csv_dir:
+        recorded = load_csv_dir(args.csv_dir)
+    elif args.store:
+        recorded = load_store(args.store, args.interval, 1000)
+    fixtures = Fixtures(recorded, args.seed)
+
+    report = {
+        'meta': {
+            'fixtures': 'recorded' if recorded else 'synthetic',
+            'processes': args.processes,
+            'python': sys.version.split()[0],
+            'created': int(time.time()),
+        },
+        'micro': run_micro(fixtures, args.micro_symbols, args.repeat),
+        'pipeline': {},
+    }
+    if not args.skip_pipeline:
+        for size in (int(size) for size in args.sizes.split(',')):
+            report['pipeline'][str(size)] = asyncio.run(
+                run_pipeline(fixtures, size, args.cycles, args.latency / 1000, args.bybit_rate, args.processes)
+            )
+
+    print(format_table([dict(stage=stage, **stats) for stage, stats in flatten(report).items()]))
+    for size, pipeline in report['pipeline'].items():
+        print(f"{size} символов: запросов свечей {pipeline['kline_requests']}, сообщений Telegram {pipeline['telegram_messages']}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            rows = compare(report, json.load(f), args.tolerance)
+        print(format_table(rows))
+        if any(row['status'] == 'REGRESSION' for row in rows):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
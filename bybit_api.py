@@ -1,35 +1,263 @@
 # bybit_api.py
+import json
 import logging
+import os
+import random
+import time
 import aiohttp
 import asyncio
+from candles import Candles
+from metrics import metrics
+from rate_limit import TokenBucket
 
-API_BASE_URL = "https://api.bybit.com/v5/market/"
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-async def get_usdt_perpetual_symbols():
+API_BASE_URL = os.getenv("BYBIT_API_URL", "https://api.bybit.com/v5/market/")
+MAX_KLINE_LIMIT = 1000  # Максимум свечей в одном ответе Bybit
+
+# Декодер JSON ответов: orjson при наличии, иначе стандартный json (можно заменить через set_json_decoder)
+json_loads = orjson.loads if orjson is not None else json.loads
+
+def set_json_decoder(loads):
+    """
+    Заменяет функцию разбора JSON ответов Bybit (принимает bytes, возвращает объект).
+    """
+    global json_loads
+    json_loads = loads
+
+# Длительность интервалов Bybit в миллисекундах
+INTERVAL_MS = {
+    '1': 60_000,
+    '5': 300_000,
+    '15': 900_000,
+    '30': 1_800_000,
+    '60': 3_600_000,
+    '240': 14_400_000,
+    '720': 43_200_000,
+    'D': 86_400_000,
+}
+
+# Параметры пула соединений
+HTTP_LIMIT = int(os.getenv("HTTP_LIMIT", 100))  # Общее число соединений
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", 50))  # Соединений на один хост
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))  # Кэш DNS, сек.
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 60))  # Удержание простаивающих соединений, сек.
+
+# Тайм-ауты запросов, сек.
+HTTP_TOTAL_TIMEOUT = float(os.getenv("HTTP_TOTAL_TIMEOUT", 30))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 15))
+
+# Ограничение частоты запросов к Bybit
+RATE_LIMIT_RPS = float(os.getenv("BYBIT_RATE_LIMIT", 50))  # Максимум запросов в секунду
+RATE_LIMIT_BURST = int(os.getenv("BYBIT_RATE_BURST", 20))  # Размер пачки без ожидания
+RATE_LIMIT_RET_CODES = (10006, 10018)  # Коды Bybit: слишком много запросов / превышен лимит IP
+
+_session = None
+
+class RateLimitError(Exception):
+    """
+    Bybit сообщил о превышении лимита запросов.
+    """
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RateLimiter(TokenBucket):
+    """
+    Адаптивный ограничитель частоты запросов (token bucket).
+
+    Скорость пополнения подстраивается по заголовкам X-Bapi-Limit-Status и
+    X-Bapi-Limit-Reset-Timestamp, чтобы оставаться чуть ниже разрешённой биржей.
+    """
+
+    def __init__(self, rate, burst, safety=0.9, reserve=2):
+        """
+        :param rate: Максимальная скорость, запросов в секунду.
+        :param burst: Ёмкость корзины.
+        :param safety: Доля разрешённой биржей скорости, которую используем.
+        :param reserve: Остаток лимита, при котором ждём сброса окна.
+        """
+        super().__init__(rate, burst)
+        self.max_rate = rate
+        self.safety = safety
+        self.reserve = reserve
+
+    def block(self, seconds):
+        """
+        Приостанавливает запросы на заданное время и снижает скорость.
+        """
+        super().block(seconds)
+        self.rate = max(1.0, self.rate / 2)
+
+    def update_from_headers(self, headers):
+        """
+        Подстраивает скорость по заголовкам лимитов Bybit.
+        """
+        remaining = headers.get('X-Bapi-Limit-Status')
+        reset_timestamp = headers.get('X-Bapi-Limit-Reset-Timestamp')
+        if remaining is None or reset_timestamp is None:
+            # Без заголовков постепенно возвращаемся к максимальной скорости после блокировки
+            self.rate = min(self.max_rate, self.rate * 1.05)
+            return
+
+        try:
+            remaining = int(remaining)
+            reset_in = int(reset_timestamp) / 1000 - time.time()
+        except ValueError:
+            return
+
+        if reset_in <= 0:
+            self.rate = self.max_rate
+        elif remaining <= self.reserve:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + reset_in)
+        else:
+            allowed_rate = (remaining - self.reserve) * self.safety / reset_in
+            self.rate = max(1.0, min(self.max_rate, allowed_rate))
+
+rate_limiter = RateLimiter(RATE_LIMIT_RPS, RATE_LIMIT_BURST)
+
+def check_rate_limit(response):
+    """
+    Обновляет ограничитель по ответу и поднимает RateLimitError при превышении лимита.
+    """
+    rate_limiter.update_from_headers(response.headers)
+    if response.status in (403, 429):
+        # 403 Bybit возвращает при временной блокировке IP за частые запросы
+        retry_after = float(response.headers.get('Retry-After', 5 if response.status == 429 else 60))
+        metrics.inc('rate_limited')
+        rate_limiter.block(retry_after)
+        raise RateLimitError(f"HTTP {response.status}", retry_after)
+    if response.status >= 500:
+        response.raise_for_status()
+
+RETRYABLE_ERRORS = (RateLimitError, aiohttp.ClientResponseError, aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+def create_session() -> aiohttp.ClientSession:
+    """
+    Создаёт HTTP-сессию с настроенным пулом соединений и тайм-аутами.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=HTTP_TOTAL_TIMEOUT,
+        connect=HTTP_CONNECT_TIMEOUT,
+        sock_read=HTTP_READ_TIMEOUT,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Возвращает общую HTTP-сессию, создавая её при первом обращении.
+    Должна вызываться внутри работающего цикла событий.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = create_session()
+    return _session
+
+async def close_session():
+    """
+    Закрывает общую HTTP-сессию.
+    """
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+async def get_instruments_info(session=None):
+    """
+    Загружает все линейные контракты, проходя по всем страницам (nextPageCursor).
+
+    :return: Список описаний инструментов или None при ошибке.
+    """
     url = f"{API_BASE_URL}instruments-info"
     params = {
-        "category": "linear"
+        "category": "linear",
+        "limit": 1000
     }
-    async with aiohttp.ClientSession() as session:
-        try:
+    session = session or get_session()
+    instruments = []
+    try:
+        while True:
+            await rate_limiter.acquire()
             async with session.get(url, params=params) as response:
+                check_rate_limit(response)
                 data = await response.json()
-                if data['retCode'] == 0:
-                    symbols = [
-                        symbol['symbol'] for symbol in data['result']['list']
-                        if symbol['contractType'] == 'LinearPerpetual' and
-                           symbol['settleCoin'] == 'USDT' and
-                           symbol['status'] == 'Trading'
-                    ]
-                    return symbols
-                else:
-                    logging.error(f"Ошибка при получении списка символов: {data['retMsg']}")
-                    return []
-        except Exception as e:
-            logging.exception(f"Произошла ошибка при получении списка символов: {e}")
-            return []
+            if data['retCode'] != 0:
+                logging.error("Ошибка при получении списка символов: %s", data['retMsg'])
+                return None
 
-async def get_historical_kline_data(session, symbol, interval, limit):
+            instruments.extend(data['result']['list'])
+            cursor = data['result'].get('nextPageCursor')
+            if not cursor:
+                return instruments
+            params["cursor"] = cursor
+    except Exception as e:
+        logging.exception("Произошла ошибка при получении списка символов: %s", e)
+        return None
+
+async def get_tickers(session=None):
+    """
+    Загружает тикеры всех линейных контрактов одним запросом.
+
+    :return: Словарь {символ: {lastPrice, highPrice24h, lowPrice24h, turnover24h, volume24h}}
+             с числовыми значениями или None при ошибке.
+    """
+    url = f"{API_BASE_URL}tickers"
+    session = session or get_session()
+    try:
+        await rate_limiter.acquire()
+        async with session.get(url, params={"category": "linear"}) as response:
+            check_rate_limit(response)
+            body = await response.read()
+        data = json_loads(body)
+        if data['retCode'] != 0:
+            logging.error("Ошибка при получении тикеров: %s", data['retMsg'])
+            return None
+
+        tickers = {}
+        for item in data['result']['list']:
+            try:
+                tickers[item['symbol']] = {
+                    field: float(item[field])
+                    for field in ('lastPrice', 'highPrice24h', 'lowPrice24h', 'turnover24h', 'volume24h')
+                }
+            except (KeyError, ValueError):
+                # Тикер без цены (например, только что добавленный контракт) не используется
+                continue
+        return tickers
+    except Exception as e:
+        logging.error("Произошла ошибка при получении тикеров: %s", e)
+        return None
+
+def is_usdt_perpetual(instrument):
+    return (instrument['contractType'] == 'LinearPerpetual' and
+            instrument['settleCoin'] == 'USDT' and
+            instrument['status'] == 'Trading')
+
+async def get_usdt_perpetual_symbols(session=None):
+    instruments = await get_instruments_info(session)
+    if not instruments:
+        return []
+    return [instrument['symbol'] for instrument in instruments if is_usdt_perpetual(instrument)]
+
+async def get_historical_kline_data(session, symbol, interval, limit, start=None, end=None, columns=False):
+    """
+    Загружает свечи одним запросом.
+
+    Тело ответа разбирается из байтов декодером json_loads; при columns=True поле
+    result.list сразу переводится в колоночные Candles.
+
+    :return: Свечи от старых к новым (строки Bybit или Candles) или пустой список при ошибке.
+    """
     url = f"{API_BASE_URL}kline"
     params = {
         "category": "linear",
@@ -37,34 +265,143 @@ async def get_historical_kline_data(session, symbol, interval, limit):
         "interval": interval,
         "limit": limit
     }
+    if start is not None:
+        params["start"] = start
+    if end is not None:
+        params["end"] = end
     try:
+        await rate_limiter.acquire()
         async with session.get(url, params=params) as response:
-            data = await response.json()
+            check_rate_limit(response)
+            body = await response.read()
+        with metrics.timer('parse'):
+            data = json_loads(body)
+            if data['retCode'] in RATE_LIMIT_RET_CODES:
+                metrics.inc('rate_limited')
+                rate_limiter.block(1.0)
+                raise RateLimitError(data['retMsg'])
             if data['retCode'] == 0 and data['result']:
                 candle_list = data['result']['list']
-                candle_list = candle_list[::-1]
-                return candle_list
+                if columns:
+                    return Candles.from_bybit_list(candle_list)
+                return candle_list[::-1]
             else:
-                logging.error(f"Ошибка при получении данных свечей для {symbol}: {data['retMsg']}")
+                logging.error("Ошибка при получении данных свечей для %s: %s", symbol, data['retMsg'])
                 return []
+    except RETRYABLE_ERRORS:
+        # Обрабатываются повторными попытками в get_kline_with_retries
+        raise
+    except ValueError as e:
+        # Тело ответа не JSON (например, HTML-страница ошибки)
+        logging.error("Неверный формат ответа для %s на интервале %s: %s", symbol, interval, e)
+        return None
     except Exception as e:
-        logging.exception(f"Произошла ошибка при получении данных свечей для {symbol}: {e}")
+        logging.exception("Произошла ошибка при получении данных свечей для %s: %s", symbol, e)
         return []
 
-async def get_kline_with_retries(session, symbol, interval, limit, retries=3, delay=1):
+def backoff_delay(attempt, base_delay=1.0, max_delay=30.0):
+    """
+    Экспоненциальная задержка с джиттером для повторной попытки.
+
+    :param attempt: Номер неудачной попытки (с нуля).
+    :param base_delay: Базовая задержка, сек.
+    :param max_delay: Максимальная задержка, сек.
+    """
+    return min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+async def get_kline_with_retries(session, symbol, interval, limit, retries=3, delay=1, start=None, end=None, columns=False):
     for attempt in range(retries):
         try:
-            return await get_historical_kline_data(session, symbol, interval, limit)
-        except aiohttp.ClientResponseError as e:
+            return await get_historical_kline_data(session, symbol, interval, limit, start, end, columns)
+        except aiohttp.ContentTypeError as e:
+            logging.error("Неверный тип содержимого для %s на интервале %s: %s", symbol, interval, e)
+            return None
+        except RETRYABLE_ERRORS as e:
             if attempt < retries - 1:
-                logger.warning(f"Попытка {attempt + 1} для {symbol} на интервале {interval} не удалась. Повтор через {delay} сек.")
-                await asyncio.sleep(delay)
+                wait_time = backoff_delay(attempt, delay)
+                if isinstance(e, RateLimitError):
+                    wait_time = max(wait_time, e.retry_after)
+                metrics.inc('retries')
+                logging.warning("Попытка %d для %s на интервале %s не удалась. Повтор через %.2f сек.", attempt + 1, symbol, interval, wait_time)
+                await asyncio.sleep(wait_time)
             else:
-                logger.error(f"Ошибка при получении данных для {symbol} на интервале {interval}: {e}")
+                metrics.inc('fetch_failures')
+                logging.error("Ошибка при получении данных для %s на интервале %s: %s", symbol, interval, e)
                 return None
-        except aiohttp.ContentTypeError as e:
-            logger.error(f"Неверный тип содержимого для {symbol} на интервале {interval}: {e}")
-            return None
         except Exception as e:
-            logger.error(f"Неизвестная ошибка для {symbol} на интервале {interval}: {e}")
+            logging.error("Неизвестная ошибка для %s на интервале %s: %s", symbol, interval, e)
+            return None
+
+async def get_kline_range(session, symbol, interval, start, end):
+    """
+    Загружает свечи с временем открытия в диапазоне [start, end], постранично
+    (не более MAX_KLINE_LIMIT свечей за запрос).
+
+    :return: Свечи от старых к новым или None при ошибке.
+    """
+    interval_ms = INTERVAL_MS[interval]
+    rows = []
+    page_end = end
+    while page_end >= start:
+        count = (page_end - start) // interval_ms + 1
+        page = await get_kline_with_retries(session, symbol, interval, limit=min(count, MAX_KLINE_LIMIT),
+                                            start=start, end=page_end)
+        if page is None:
             return None
+        rows = page + rows
+        if count <= MAX_KLINE_LIMIT or not page:
+            break
+        page_end = int(page[0][0]) - interval_ms
+    return rows
+
+async def get_latest_klines(session, symbol, interval, limit, columns=False):
+    """
+    Загружает последние `limit` свечей, при необходимости постранично.
+
+    :param columns: Вернуть колоночные Candles вместо строк Bybit.
+    :return: Свечи от старых к новым (последняя — текущая незакрытая) или None при ошибке.
+    """
+    if limit <= MAX_KLINE_LIMIT:
+        return await get_kline_with_retries(session, symbol, interval, limit, columns=columns)
+    interval_ms = INTERVAL_MS[interval]
+    current_start = int(time.time() * 1000) // interval_ms * interval_ms
+    rows = await get_kline_range(session, symbol, interval, current_start - (limit - 1) * interval_ms, current_start)
+    if columns and rows is not None:
+        return Candles.from_rows(rows)
+    return rows
+
+async def get_kline_cached(session, store, symbol, interval, limit):
+    """
+    Возвращает последние `limit` свечей из локального хранилища, догружая с биржи
+    только недостающие свечи (начиная с последней сохранённой, которая могла быть незакрытой).
+
+    Если в окне до последней сохранённой свечи есть пропуски (хранилище заполнялось
+    с меньшим limit, после простоя или для недавно добавленного символа), окно
+    загружается целиком.
+
+    :param store: Хранилище свечей CandleStore.
+    :return: Свечи от старых к новым (последняя — текущая незакрытая) или None при ошибке,
+             в том числе если текущая свеча не получена.
+    """
+    interval_ms = INTERVAL_MS[interval]
+    current_start = int(time.time() * 1000) // interval_ms * interval_ms
+    window_start = current_start - (limit - 1) * interval_ms
+
+    last_start = store.last_start(symbol, interval)
+    fetch_from = window_start
+    if last_start is not None and last_start >= window_start:
+        # Свечи от начала окна до последней сохранённой должны идти без пропусков
+        expected = (last_start - window_start) // interval_ms + 1
+        if store.count(symbol, interval, window_start, last_start) >= expected:
+            fetch_from = last_start
+
+    rows = await get_kline_range(session, symbol, interval, fetch_from, current_start)
+    if rows is None:
+        return None
+    store.save(symbol, interval, rows)
+    stored = store.load(symbol, interval, limit)
+    if not stored or int(stored[-1][0]) != current_start:
+        # Биржа не вернула текущую свечу (ошибка или пустой ответ): сохранённое окно устарело
+        logging.warning("Нет текущей свечи для %s на интервале %s, сохранённые свечи не используются.", symbol, interval)
+        return None
+    return stored
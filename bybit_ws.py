@@ -0,0 +1,293 @@
+# bybit_ws.py
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+import aiohttp
+from bybit_api import get_latest_klines, INTERVAL_MS
+from candles import Candles
+from streaming_indicators import IndicatorRegistry
+
+WS_URL = os.getenv("BYBIT_WS_URL", "wss://stream.bybit.com/v5/public/linear")
+
+KLINE_FIELDS = ('start', 'open', 'high', 'low', 'close', 'volume', 'turnover')
+
+class KlineStream:
+    """
+    Подписка на закрытые свечи Bybit через WebSocket (`kline.{interval}.{symbol}`).
+
+    Хранит последние `history` подтверждённых свечей по каждой паре (символ, интервал)
+    в колоночном виде Candles (от старых к новым): каждая свеча разбирается в числа один раз
+    при получении. При переподключении подписки восстанавливаются, а пропуски заполняются через REST.
+
+    Если передан реестр indicators, индикаторы каждой пары обновляются по каждой новой
+    закрытой свече за O(1), а EMA переносятся через всю историю потока.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, symbols: List[str], intervals: List[str],
+                 on_candle: Optional[Callable[[str, str, list], Awaitable[None]]] = None,
+                 url: str = WS_URL, history: Union[int, Dict[str, int]] = 36, batch_size: int = 10,
+                 ping_interval: float = 20, reconnect_delay: float = 5,
+                 backfill_concurrency: int = 10, indicators: Optional[IndicatorRegistry] = None,
+                 logger: Optional[logging.Logger] = None):
+        """
+        :param session: HTTP-сессия для WebSocket и REST-дозагрузки.
+        :param symbols: Список символов.
+        :param intervals: Интервалы Bybit ('15', '60', ...).
+        :param on_candle: Корутина, вызываемая для каждой новой закрытой свечи.
+        :param url: Адрес WebSocket (можно указать локальный сервер для тестов).
+        :param history: Количество хранимых свечей на пару (одно для всех интервалов или по интервалам).
+        :param batch_size: Количество топиков в одном запросе подписки.
+        :param ping_interval: Интервал ping-сообщений, сек.
+        :param reconnect_delay: Задержка перед переподключением, сек.
+        :param backfill_concurrency: Количество одновременных REST-запросов при дозагрузке.
+        :param indicators: Реестр потоковых индикаторов или None.
+        :param logger: Логгер.
+        """
+        self.session = session
+        self.symbols = list(symbols)
+        self.intervals = list(intervals)
+        self.on_candle = on_candle
+        self.url = url
+        self.history = history
+        self.batch_size = batch_size
+        self.ping_interval = ping_interval
+        self.reconnect_delay = reconnect_delay
+        self.indicators = indicators
+        self.logger = logger or logging.getLogger(__name__)
+        self.candles: Dict[Tuple[str, str], Candles] = {}
+        self.connected = asyncio.Event()
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._backfill_semaphore = asyncio.Semaphore(backfill_concurrency)
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self._closed = False
+
+    def topics(self, symbols: Optional[List[str]] = None) -> List[str]:
+        symbols = self.symbols if symbols is None else symbols
+        return [f"kline.{interval}.{symbol}" for symbol in symbols for interval in self.intervals]
+
+    def history_for(self, interval: str) -> int:
+        return self.history[interval] if isinstance(self.history, dict) else self.history
+
+    def get_candles(self, symbol: str, interval: str, limit: Optional[int] = None) -> Candles:
+        """
+        Возвращает сохранённые закрытые свечи (от старых к новым).
+
+        :param limit: Количество последних свечей (по умолчанию вся история пары).
+        """
+        candles = self.candles.get((symbol, interval))
+        if not candles:
+            return Candles()
+        history = self.history_for(interval)
+        return candles[-(history if limit is None else min(limit, history)):]
+
+    def get_indicators(self, symbol: str, interval: str, start: int) -> Optional[Dict[str, float]]:
+        """
+        Возвращает значения потоковых индикаторов пары на свече start
+        или None, если они не рассчитаны или относятся к другой свече.
+        """
+        if self.indicators is None:
+            return None
+        state = self.indicators.states.get((symbol, interval))
+        if state is None or state.last_start != start:
+            return None
+        values = state.snapshot()
+        if None in values.values():
+            return None
+        return values
+
+    def is_fresh(self, symbol: str, interval: str, now_ms: Optional[int] = None) -> bool:
+        """
+        Проверяет, что последняя сохранённая свеча — последняя закрытая на бирже.
+        """
+        candles = self.candles.get((symbol, interval))
+        if not candles:
+            return False
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        return candles.start[-1] + 2 * INTERVAL_MS[interval] > now_ms
+
+    async def run(self):
+        """
+        Основной цикл: подключение, подписка, дозагрузка и чтение сообщений.
+        Переподключается при обрыве соединения до вызова close().
+        """
+        while not self._closed:
+            try:
+                async with self.session.ws_connect(self.url, heartbeat=None) as ws:
+                    self._ws = ws
+                    await self._subscribe(ws, self.topics())
+                    self.connected.set()
+                    self.logger.info("WebSocket подключён: %s, топиков: %d", self.url, len(self.topics()))
+
+                    # Дозагружаем свечи, пропущенные до подключения или во время обрыва
+                    backfill_task = asyncio.create_task(self.backfill_all())
+                    ping_task = asyncio.create_task(self._ping(ws))
+                    try:
+                        async for message in ws:
+                            if message.type == aiohttp.WSMsgType.TEXT:
+                                await self._handle(json.loads(message.data))
+                            elif message.type in (aiohttp.WSMsgType.ERROR, aiohttp.WSMsgType.CLOSED):
+                                break
+                    finally:
+                        ping_task.cancel()
+                        backfill_task.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error("Ошибка WebSocket: %s", e)
+            finally:
+                self._ws = None
+                self.connected.clear()
+
+            if not self._closed:
+                self.logger.warning("WebSocket отключён. Переподключение через %s сек.", self.reconnect_delay)
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def close(self):
+        self._closed = True
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def update_symbols(self, symbols: List[str]):
+        """
+        Обновляет список символов, подписываясь на новые и отписываясь от удалённых.
+        """
+        added = [symbol for symbol in symbols if symbol not in self.symbols]
+        removed = [symbol for symbol in self.symbols if symbol not in symbols]
+        self.symbols = list(symbols)
+        for symbol in removed:
+            for interval in self.intervals:
+                self.candles.pop((symbol, interval), None)
+                if self.indicators is not None:
+                    self.indicators.discard(symbol, interval)
+
+        if self._ws is None:
+            return
+        if removed:
+            await self._subscribe(self._ws, self.topics(removed), op="unsubscribe")
+        if added:
+            await self._subscribe(self._ws, self.topics(added))
+            await asyncio.gather(*(self.backfill(symbol, interval) for symbol in added for interval in self.intervals))
+
+    async def backfill_all(self):
+        await asyncio.gather(*(self.backfill(symbol, interval) for symbol in self.symbols for interval in self.intervals))
+
+    async def backfill(self, symbol: str, interval: str):
+        """
+        Заполняет пропуски в свечах пары через REST.
+
+        Загруженные свечи объединяются с уже сохранёнными по времени открытия, поэтому
+        подтверждённые свечи WebSocket, пришедшие раньше окончания дозагрузки, не вытесняют историю.
+        """
+        async with self._backfill_semaphore:
+            kline_data = await get_latest_klines(self.session, symbol, interval, self.history_for(interval) + 1)
+        if not kline_data:
+            self.logger.warning("Не удалось дозагрузить свечи для %s на интервале %s.", symbol, interval)
+            return
+
+        # Последняя свеча из REST ещё не закрыта
+        await self._merge_candles(symbol, interval, kline_data[:-1])
+
+    async def _subscribe(self, ws: aiohttp.ClientWebSocketResponse, topics: List[str], op: str = "subscribe"):
+        for i in range(0, len(topics), self.batch_size):
+            await ws.send_json({"op": op, "args": topics[i:i + self.batch_size]})
+
+    async def _ping(self, ws: aiohttp.ClientWebSocketResponse):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            await ws.send_json({"op": "ping"})
+
+    async def _handle(self, message: dict):
+        topic = message.get("topic", "")
+        if not topic.startswith("kline."):
+            if message.get("success") is False:
+                self.logger.error("Ошибка операции WebSocket %s: %s", message.get('op'), message.get('ret_msg'))
+            return
+
+        _, interval, symbol = topic.split(".", 2)
+        for item in message.get("data", []):
+            if item.get("confirm"):
+                row = [str(item['start'])] + [str(item[field]) for field in KLINE_FIELDS[1:]]
+                await self._add_candle(symbol, interval, row)
+
+    async def _add_candle(self, symbol: str, interval: str, row: list, check_gap: bool = True):
+        key = (symbol, interval)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            candles = self.candles.get(key)
+            start = int(row[0])
+            last_start = candles.start[-1] if candles else None
+            if last_start is not None and start <= last_start:
+                return
+
+        if check_gap and last_start is not None and start - last_start > INTERVAL_MS[interval]:
+            self.logger.warning("Пропуск свечей для %s на интервале %s. Дозагрузка через REST.", symbol, interval)
+            await self.backfill(symbol, interval)
+
+        async with lock:
+            # Дозагрузка могла заменить свечи пары
+            candles = self.candles.setdefault(key, Candles())
+            if candles and start <= candles.start[-1]:
+                return
+            candles.append(row)
+            history = self.history_for(interval)
+            if len(candles) > history + history // 4:
+                # Старые свечи удаляются пачкой, а не по одной на каждую новую
+                candles.trim(history)
+            if self.indicators is not None:
+                self._update_indicators(symbol, interval, candles)
+
+        if self.on_candle is not None:
+            await self.on_candle(symbol, interval, row)
+
+    async def _merge_candles(self, symbol: str, interval: str, rows: List[list]):
+        key = (symbol, interval)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            candles = self.candles.get(key) or Candles()
+            stored = set(candles.start)
+            last_start = candles.start[-1] if candles else None
+            merged = {int(row[0]): row for row in rows}
+            # Уже сохранённые подтверждённые свечи имеют приоритет над REST
+            merged.update(
+                (start, (start, candles.open[i], candles.high[i], candles.low[i], candles.close[i], candles.volume[i]))
+                for i, start in enumerate(candles.start)
+            )
+            starts = sorted(merged)[-self.history_for(interval):]
+            added = [start for start in starts if start not in stored]
+            if not added:
+                return
+            self.candles[key] = candles = Candles.from_rows(merged[start] for start in starts)
+            new_rows = [merged[start] for start in added if last_start is None or start > last_start]
+            if self.indicators is not None:
+                # Более старые свечи вставлены в историю — состояние строится заново
+                appended = last_start is not None and len(new_rows) == len(added)
+                self._update_indicators(symbol, interval, candles, len(new_rows) if appended else None)
+
+        if self.on_candle is not None:
+            for row in new_rows:
+                await self.on_candle(symbol, interval, row)
+
+    def _update_indicators(self, symbol: str, interval: str, candles: Candles, added: Optional[int] = 1):
+        """
+        :param added: Количество добавленных в конец свечей; None — пересчитать состояние заново.
+        """
+        interval_ms = INTERVAL_MS[interval]
+        state = self.indicators.get(symbol, interval)
+        first = len(candles) - (added or 0)
+        starts = [state.last_start] + list(candles.start[first:])
+        if added is not None and state.last_start is not None and all(
+                later - earlier == interval_ms for earlier, later in zip(starts, starts[1:])):
+            for i in range(first, len(candles)):
+                state.update(candles.start[i], candles.high[i], candles.low[i], candles.close[i])
+            return
+
+        # Первая свеча, пропуск или дозагрузка истории: состояние строится заново по непрерывному хвосту свечей
+        state = self.indicators.reset(symbol, interval)
+        first = len(candles) - 1
+        while first > 0 and candles.start[first] - candles.start[first - 1] == interval_ms:
+            first -= 1
+        for i in range(first, len(candles)):
+            state.update(candles.start[i], candles.high[i], candles.low[i], candles.close[i])
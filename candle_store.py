@@ -0,0 +1,132 @@
+# candle_store.py
+import sqlite3
+import time
+from typing import List, Optional
+
+class CandleStore:
+    """
+    Локальное хранилище свечей в SQLite по ключу (символ, интервал).
+
+    Строки хранятся в формате REST Bybit: [start, open, high, low, close, volume, turnover],
+    от старых к новым. Для каждой свечи запоминается время сохранения: последняя свеча
+    могла быть сохранена незакрытой.
+    """
+
+    def __init__(self, path: str = 'candles.db', max_history: int = 1000):
+        """
+        :param path: Путь к файлу базы данных.
+        :param max_history: Максимальное количество хранимых свечей на пару.
+        """
+        self.path = path
+        self.max_history = max_history
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS candles (
+                symbol TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                start INTEGER NOT NULL,
+                open REAL NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL,
+                close REAL NOT NULL,
+                volume REAL NOT NULL,
+                turnover REAL NOT NULL,
+                saved_at INTEGER,
+                PRIMARY KEY (symbol, interval, start)
+            ) WITHOUT ROWID
+            """
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(candles)")]
+        if 'saved_at' not in columns:
+            # Хранилище, созданное до появления колонки: время сохранения старых свечей неизвестно
+            self.conn.execute("ALTER TABLE candles ADD COLUMN saved_at INTEGER")
+        self.conn.commit()
+
+    def last_start(self, symbol: str, interval: str) -> Optional[int]:
+        """
+        Возвращает время открытия последней сохранённой свечи (мс) или None.
+        """
+        row = self.conn.execute(
+            "SELECT MAX(start) FROM candles WHERE symbol = ? AND interval = ?",
+            (symbol, interval),
+        ).fetchone()
+        return row[0]
+
+    def saved_at(self, symbol: str, interval: str, start: int) -> Optional[int]:
+        """
+        Возвращает время сохранения свечи (мс) или None, если оно неизвестно.
+        """
+        row = self.conn.execute(
+            "SELECT saved_at FROM candles WHERE symbol = ? AND interval = ? AND start = ?",
+            (symbol, interval, start),
+        ).fetchone()
+        return row[0] if row else None
+
+    def count(self, symbol: str, interval: str, start: int, end: int) -> int:
+        """
+        Возвращает количество сохранённых свечей с временем открытия в диапазоне [start, end].
+        """
+        row = self.conn.execute(
+            "SELECT COUNT(*) FROM candles WHERE symbol = ? AND interval = ? AND start BETWEEN ? AND ?",
+            (symbol, interval, start, end),
+        ).fetchone()
+        return row[0]
+
+    def symbols(self, interval: str) -> List[str]:
+        """
+        Возвращает символы, для которых сохранены свечи интервала.
+        """
+        rows = self.conn.execute(
+            "SELECT DISTINCT symbol FROM candles WHERE interval = ? ORDER BY symbol",
+            (interval,),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def load(self, symbol: str, interval: str, limit: int) -> List[list]:
+        """
+        Возвращает последние `limit` свечей (от старых к новым).
+        """
+        rows = self.conn.execute(
+            """
+            SELECT start, open, high, low, close, volume, turnover FROM candles
+            WHERE symbol = ? AND interval = ? ORDER BY start DESC LIMIT ?
+            """,
+            (symbol, interval, limit),
+        ).fetchall()
+        return [list(row) for row in reversed(rows)]
+
+    def save(self, symbol: str, interval: str, rows: List[list]):
+        """
+        Сохраняет свечи, перезаписывая уже сохранённые с тем же временем открытия,
+        и удаляет свечи сверх max_history.
+        """
+        if not rows:
+            return
+        saved_at = int(time.time() * 1000)
+        self.conn.executemany(
+            """
+            INSERT OR REPLACE INTO candles (symbol, interval, start, open, high, low, close, volume, turnover, saved_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (symbol, interval, int(row[0]), float(row[1]), float(row[2]), float(row[3]),
+                 float(row[4]), float(row[5]), float(row[6]) if len(row) > 6 else 0.0, saved_at)
+                for row in rows
+            ],
+        )
+        self.conn.execute(
+            """
+            DELETE FROM candles WHERE symbol = ? AND interval = ? AND start < (
+                SELECT start FROM candles WHERE symbol = ? AND interval = ?
+                ORDER BY start DESC LIMIT 1 OFFSET ?
+            )
+            """,
+            (symbol, interval, symbol, interval, self.max_history - 1),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,80 @@
+# candles.py
+from array import array
+from typing import Iterable, Sequence
+
+class Candles:
+    """
+    Свечи в колоночном виде: по массиву array для каждого поля, от старых к новым.
+
+    Строки Bybit разбираются в числа один раз при создании, индикаторы работают
+    с готовыми колонками без повторного float().
+    """
+    __slots__ = ('start', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, start: array = None, open: array = None, high: array = None,
+                 low: array = None, close: array = None, volume: array = None):
+        self.start = start if start is not None else array('q')
+        self.open = open if open is not None else array('d')
+        self.high = high if high is not None else array('d')
+        self.low = low if low is not None else array('d')
+        self.close = close if close is not None else array('d')
+        self.volume = volume if volume is not None else array('d')
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence]) -> 'Candles':
+        """
+        Создаёт свечи из строк формата Bybit: [start, open, high, low, close, volume, ...].
+
+        :param rows: Строки свечей (от старых к новым), значения — строки или числа.
+        """
+        candles = cls()
+        for row in rows:
+            candles.append(row)
+        return candles
+
+    @classmethod
+    def from_bybit_list(cls, items: Sequence[Sequence]) -> 'Candles':
+        """
+        Создаёт свечи из поля result.list ответа Bybit (от новых к старым) без промежуточного
+        переворота списка: каждая колонка разбирается сразу в массив, turnover не читается.
+        """
+        return cls(
+            array('q', [int(row[0]) for row in reversed(items)]),
+            array('d', [float(row[1]) for row in reversed(items)]),
+            array('d', [float(row[2]) for row in reversed(items)]),
+            array('d', [float(row[3]) for row in reversed(items)]),
+            array('d', [float(row[4]) for row in reversed(items)]),
+            array('d', [float(row[5]) for row in reversed(items)]),
+        )
+
+    def append(self, row: Sequence):
+        """
+        Добавляет свечу в формате Bybit: [start, open, high, low, close, volume, ...].
+        """
+        self.start.append(int(row[0]))
+        self.open.append(float(row[1]))
+        self.high.append(float(row[2]))
+        self.low.append(float(row[3]))
+        self.close.append(float(row[4]))
+        self.volume.append(float(row[5]))
+
+    def trim(self, count: int):
+        """
+        Оставляет только последние count свечей.
+        """
+        excess = len(self) - count
+        if excess > 0:
+            for column in (self.start, self.open, self.high, self.low, self.close, self.volume):
+                del column[:excess]
+
+    def __len__(self) -> int:
+        return len(self.close)
+
+    def __getitem__(self, index: slice) -> 'Candles':
+        if not isinstance(index, slice):
+            raise TypeError("Candles поддерживает только срезы")
+        return Candles(self.start[index], self.open[index], self.high[index],
+                       self.low[index], self.close[index], self.volume[index])
+
+    def __repr__(self) -> str:
+        return f"Candles(len={len(self)})"
@@ -0,0 +1,227 @@
+# config.py
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Mapping, Optional, Tuple
+
+# Названия интервалов Bybit
+INTERVAL_NAMES = {
+    '1': '1m',
+    '5': '5m',
+    '15': '15m',
+    '30': '30m',
+    '60': '1h',
+    '240': '4h',
+    '720': '12h',
+    'D': '1d',
+}
+
+# Длительность интервалов в минутах
+INTERVAL_MINUTES = {
+    '1': 1,
+    '5': 5,
+    '15': 15,
+    '30': 30,
+    '60': 60,
+    '240': 240,
+    '720': 720,
+    'D': 1440,
+}
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Настройки бота, загружаемые и проверяемые один раз при запуске.
+    """
+    bot_token: str = ''
+    chat_id: str = ''
+    message_limit: int = 20
+
+    # Индикаторы
+    k_period: int = 14
+    d_period: int = 3
+    fast_period: int = 12
+    slow_period: int = 26
+    signal_period: int = 9
+
+    # Зоны перекупленности и перепроданности
+    overbought: float = 80.0
+    oversold: float = 20.0
+
+    # Фильтры process_symbol: символ отбрасывается при %K > max_percent_k или MACD < min_macd
+    max_percent_k: float = 10.0
+    min_macd: float = 0.0
+
+    # Правила в виде выражений (rules.py); по умолчанию строятся из порогов выше
+    signal_gate: Optional[str] = None  # Например: %K <= 10 & MACD >= 0
+    signal_rules: Optional[str] = None  # Например: long: %K < 20 & %D < 20; short: %K > 80 & %D > 80
+
+    # Сканирование
+    intervals: Dict[str, str] = field(default_factory=lambda: {'15': '15m'})
+    excluded_symbols: Tuple[str, ...] = ('USDCUSDT',)
+    max_concurrent_tasks: int = 50  # На один процесс
+    scan_processes: int = 1  # Процессов сканирования: символы делятся между ними
+    scan_deadline_margin: float = 5.0  # Сканирование завершается за столько секунд до следующего цикла
+
+    # Предварительный отбор по тикерам: свечи загружаются только для символов, которые могут дать сигнал
+    prescreen: bool = True
+    min_turnover_24h: float = 0.0  # Минимальный оборот за 24 часа, USDT (0 — без ограничения)
+    prescreen_tolerance: float = 0.005  # Допустимое отклонение закрытия свечи от lastPrice
+
+    # Отправка в Telegram: сигналы объединяются в сводные сообщения в темпе, допустимом для чата
+    telegram_rate: float = 1.0  # Сообщений в секунду (для групп Telegram — не больше 0.33)
+    telegram_burst: int = 3
+    digest_linger: float = 0.5  # Ожидание попутных сигналов перед отправкой, сек.
+
+    # Повторы: непрерывно держащийся сигнал отправляется снова не раньше чем через cooldown
+    signal_state_path: Optional[str] = 'signal_state.db'  # Состояние сигналов между циклами (None — без отсева повторов)
+    signal_cooldown_minutes: int = 240
+
+    # Источники данных
+    symbols_refresh_seconds: int = 3600  # Время жизни кэша списка символов
+    symbols_cache_path: Optional[str] = 'symbols.json'
+    daemon_close_delay: float = 2.0  # Задержка после закрытия свечи, сек.
+    kline_feed: str = 'rest'  # Источник свечей в режиме демона: rest или ws
+    candle_store_path: Optional[str] = None  # Локальное хранилище свечей (SQLite)
+    resample_base_interval: Optional[str] = None  # Базовый интервал для расчёта старших
+
+    # Наблюдаемость
+    log_max_bytes: int = 10 * 1024 * 1024  # Размер лог-файла до ротации
+    log_backup_count: int = 5
+    log_format: str = 'text'  # text или json (JSON lines)
+    metrics_host: str = '127.0.0.1'
+    metrics_port: Optional[int] = None  # HTTP-сервер метрик в режиме демона (None — выключен)
+
+    @property
+    def kline_limit(self) -> int:
+        """
+        Количество запрашиваемых свечей: закрытые для MACD (не меньше 35 = 26 + 9) и текущая.
+        """
+        return max(35, self.slow_period + self.signal_period) + 1
+
+def _parse(env: Mapping[str, str], name: str, convert, default, errors: list):
+    value = env.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return convert(value)
+    except ValueError:
+        errors.append(f"{name}: некорректное значение {value!r}")
+        return default
+
+def _parse_intervals(value: str) -> Dict[str, str]:
+    keys = [key.strip() for key in value.split(',') if key.strip()]
+    unknown = [key for key in keys if key not in INTERVAL_NAMES]
+    if unknown:
+        raise ValueError(f"неизвестные интервалы {unknown}")
+    return {key: INTERVAL_NAMES[key] for key in sorted(keys, key=INTERVAL_MINUTES.get)}
+
+def load_settings(env: Optional[Mapping[str, str]] = None, require_telegram: bool = True) -> Settings:
+    """
+    Загружает настройки из переменных окружения и проверяет их.
+
+    :param env: Источник переменных (по умолчанию os.environ).
+    :param require_telegram: Требовать BOT_TOKEN и CHAT_ID.
+    :return: Неизменяемый объект настроек.
+    :raises ValueError: Если настройки отсутствуют или некорректны (перечислены все ошибки).
+    """
+    env = os.environ if env is None else env
+    defaults = Settings()
+    errors = []
+
+    intervals = defaults.intervals
+    if env.get('INTERVALS'):
+        try:
+            intervals = _parse_intervals(env['INTERVALS'])
+        except ValueError as e:
+            errors.append(f"INTERVALS: {e}")
+
+    settings = Settings(
+        bot_token=env.get('BOT_TOKEN', ''),
+        chat_id=env.get('CHAT_ID', ''),
+        message_limit=_parse(env, 'MESSAGE_LIMIT', int, defaults.message_limit, errors),
+        k_period=_parse(env, 'K_PERIOD', int, defaults.k_period, errors),
+        d_period=_parse(env, 'D_PERIOD', int, defaults.d_period, errors),
+        fast_period=_parse(env, 'FAST_PERIOD', int, defaults.fast_period, errors),
+        slow_period=_parse(env, 'SLOW_PERIOD', int, defaults.slow_period, errors),
+        signal_period=_parse(env, 'SIGNAL_PERIOD', int, defaults.signal_period, errors),
+        overbought=_parse(env, 'OVERBOUGHT', float, defaults.overbought, errors),
+        oversold=_parse(env, 'OVERSOLD', float, defaults.oversold, errors),
+        max_percent_k=_parse(env, 'MAX_PERCENT_K', float, defaults.max_percent_k, errors),
+        min_macd=_parse(env, 'MIN_MACD', float, defaults.min_macd, errors),
+        signal_gate=env.get('SIGNAL_GATE') or None,
+        signal_rules=env.get('SIGNAL_RULES') or None,
+        intervals=intervals,
+        excluded_symbols=tuple(
+            symbol.strip().upper() for symbol in env.get('EXCLUDED_SYMBOLS', ','.join(defaults.excluded_symbols)).split(',')
+            if symbol.strip()
+        ),
+        max_concurrent_tasks=_parse(env, 'MAX_CONCURRENT_TASKS', int, defaults.max_concurrent_tasks, errors),
+        scan_processes=_parse(env, 'SCAN_PROCESSES', int, defaults.scan_processes, errors),
+        scan_deadline_margin=_parse(env, 'SCAN_DEADLINE_MARGIN', float, defaults.scan_deadline_margin, errors),
+        prescreen=env.get('PRESCREEN', str(defaults.prescreen)).lower() == 'true',
+        min_turnover_24h=_parse(env, 'MIN_TURNOVER_24H', float, defaults.min_turnover_24h, errors),
+        prescreen_tolerance=_parse(env, 'PRESCREEN_TOLERANCE', float, defaults.prescreen_tolerance, errors),
+        telegram_rate=_parse(env, 'TELEGRAM_RATE', float, defaults.telegram_rate, errors),
+        telegram_burst=_parse(env, 'TELEGRAM_BURST', int, defaults.telegram_burst, errors),
+        digest_linger=_parse(env, 'DIGEST_LINGER', float, defaults.digest_linger, errors),
+        signal_state_path=env.get('SIGNAL_STATE', defaults.signal_state_path) or None,
+        signal_cooldown_minutes=_parse(env, 'SIGNAL_COOLDOWN', int, defaults.signal_cooldown_minutes, errors),
+        symbols_refresh_seconds=_parse(env, 'SYMBOLS_REFRESH_SECONDS', int, defaults.symbols_refresh_seconds, errors),
+        symbols_cache_path=env.get('SYMBOLS_CACHE', defaults.symbols_cache_path) or None,
+        daemon_close_delay=_parse(env, 'DAEMON_CLOSE_DELAY', float, defaults.daemon_close_delay, errors),
+        kline_feed=env.get('KLINE_FEED', defaults.kline_feed).lower(),
+        candle_store_path=env.get('CANDLE_STORE') or None,
+        resample_base_interval=env.get('RESAMPLE_BASE_INTERVAL') or None,
+        log_max_bytes=_parse(env, 'LOG_MAX_BYTES', int, defaults.log_max_bytes, errors),
+        log_backup_count=_parse(env, 'LOG_BACKUP_COUNT', int, defaults.log_backup_count, errors),
+        log_format=env.get('LOG_FORMAT', defaults.log_format).lower(),
+        metrics_host=env.get('METRICS_HOST') or defaults.metrics_host,
+        metrics_port=_parse(env, 'METRICS_PORT', int, defaults.metrics_port, errors),
+    )
+
+    if require_telegram and (not settings.bot_token or not settings.chat_id):
+        errors.append("BOT_TOKEN и CHAT_ID должны быть установлены в .env файле.")
+    for name in ('message_limit', 'k_period', 'd_period', 'fast_period', 'slow_period',
+                 'signal_period', 'max_concurrent_tasks', 'scan_processes', 'telegram_burst'):
+        if getattr(settings, name) < 1:
+            errors.append(f"{name.upper()} должен быть больше нуля")
+    if settings.telegram_rate <= 0:
+        errors.append("TELEGRAM_RATE должен быть больше нуля")
+    if settings.scan_deadline_margin < 0:
+        errors.append("SCAN_DEADLINE_MARGIN не может быть отрицательным")
+    if settings.signal_cooldown_minutes < 0:
+        errors.append("SIGNAL_COOLDOWN не может быть отрицательным")
+    if settings.min_turnover_24h < 0:
+        errors.append("MIN_TURNOVER_24H не может быть отрицательным")
+    if not 0 <= settings.prescreen_tolerance < 1:
+        errors.append("PRESCREEN_TOLERANCE должен быть в диапазоне [0, 1)")
+    if settings.digest_linger < 0:
+        errors.append("DIGEST_LINGER не может быть отрицательным")
+    if settings.fast_period >= settings.slow_period:
+        errors.append("FAST_PERIOD должен быть меньше SLOW_PERIOD")
+    if not 0 <= settings.oversold < settings.overbought <= 100:
+        errors.append("Должно выполняться 0 <= OVERSOLD < OVERBOUGHT <= 100")
+    if not settings.intervals:
+        errors.append("INTERVALS: не задано ни одного интервала")
+    if settings.scan_processes > 1 and settings.kline_feed == 'ws':
+        errors.append("SCAN_PROCESSES > 1 несовместим с KLINE_FEED=ws: поток свечей живёт в основном процессе")
+    if settings.signal_gate or settings.signal_rules:
+        # rules.py сам использует Settings, поэтому импортируется при проверке
+        from rules import parse_conditions, parse_rules
+        for name, value, parse in (('SIGNAL_GATE', settings.signal_gate, parse_conditions),
+                                   ('SIGNAL_RULES', settings.signal_rules, parse_rules)):
+            if value:
+                try:
+                    parse(value)
+                except ValueError as e:
+                    errors.append(f"{name}: {e}")
+    if settings.log_format not in ('text', 'json'):
+        errors.append("LOG_FORMAT должен быть text или json")
+    if settings.kline_feed not in ('rest', 'ws'):
+        errors.append("KLINE_FEED должен быть rest или ws")
+    if settings.resample_base_interval is not None and settings.resample_base_interval not in INTERVAL_NAMES:
+        errors.append(f"RESAMPLE_BASE_INTERVAL: неизвестный интервал {settings.resample_base_interval!r}")
+
+    if errors:
+        raise ValueError("Некорректные настройки: " + "; ".join(errors))
+    return settings
@@ -1,45 +1,36 @@
 # helpers.py
-from typing import List, Dict, Optional, Tuple
+from typing import Dict, Optional
+from candles import Candles
 from stochastic_oscillator import calculate_stochastic_oscillator
 from macd import calculate_macd
-import os
+from batch_indicators import calculate_stochastic_oscillator_batch, calculate_macd_batch
+import numpy as np
+from config import Settings
 
-def analyze_candles(candles: List[Dict[str, float]], k_period: int = 14, d_period: int = 3,
-                   fast_period: int = 12, slow_period: int = 26, signal_period: int = 9) -> Dict[str, Optional[Dict]]:
+def analyze_candles(candles: Candles, settings: Settings) -> Dict[str, Optional[Dict]]:
     """
     Анализирует свечи на основе Стохастического осциллятора и MACD.
 
-    :param candles: Список свечей (от старых к новым) в формате List[Dict].
-    :param k_period: Период для расчета %K.
-    :param d_period: Период для расчета %D.
-    :param fast_period: Период быстрой EMA для MACD.
-    :param slow_period: Период медленной EMA для MACD.
-    :param signal_period: Период сигнальной линии для MACD.
+    :param candles: Свечи (от старых к новым).
+    :param settings: Настройки (периоды индикаторов и зоны перекупленности/перепроданности).
     :return: Анализ с сигналами.
     """
     analysis = {}
-    
-    # Получение параметров из переменных окружения
-    k_period = int(os.getenv("K_PERIOD", k_period))
-    d_period = int(os.getenv("D_PERIOD", d_period))
-    fast_period = int(os.getenv("FAST_PERIOD", fast_period))
-    slow_period = int(os.getenv("SLOW_PERIOD", slow_period))
-    signal_period = int(os.getenv("SIGNAL_PERIOD", signal_period))
-    
+
     # Рассчет Стохастического осциллятора
-    percent_k, percent_d = calculate_stochastic_oscillator(candles, k_period, d_period)
+    percent_k, percent_d = calculate_stochastic_oscillator(candles, settings.k_period, settings.d_period)
     analysis['%K'] = percent_k
     analysis['%D'] = percent_d
 
     # Рассчет MACD
-    macd, signal, histogram = calculate_macd(candles, fast_period, slow_period, signal_period)
+    macd, signal, histogram = calculate_macd(candles, settings.fast_period, settings.slow_period, settings.signal_period)
     analysis['MACD'] = macd
     analysis['Signal'] = signal
     analysis['Histogram'] = histogram
 
-    # Зоны перекупленности и перепроданности из переменных окружения
-    overbought = float(os.getenv("OVERBOUGHT"))
-    oversold = float(os.getenv("OVERSOLD"))
+    # Зоны перекупленности и перепроданности
+    overbought = settings.overbought
+    oversold = settings.oversold
 
     # Определение сигналов на основе условий
     signal_long = False
@@ -60,3 +51,71 @@ def analyze_candles(candles: List[Dict[str, float]], k_period: int = 14, d_perio
         analysis['signal'] = None
 
     return analysis
+
+def signal_strength(analysis: Dict[str, Optional[float]], close: float, settings: Settings) -> float:
+    """
+    Оценивает силу сигнала на одном интервале для ранжирования сигналов цикла.
+
+    Сигнал даёт 1 (сигналы на нескольких интервалах складываются), глубина %K и %D
+    за границей зоны — до 1, гистограмма MACD в направлении сделки относительно цены — до ±0.5.
+
+    :param analysis: Результат analyze_candles с сигналом.
+    :param close: Цена закрытия последней свечи.
+    :param settings: Настройки (зоны перекупленности/перепроданности).
+    :return: Сила сигнала (0, если сигнала нет).
+    """
+    signal = analysis.get('signal')
+    if signal is None:
+        return 0.0
+    percent_k, percent_d = analysis['%K'], analysis['%D']
+
+    if signal == 'long':
+        direction = 1
+        zone = settings.oversold
+        depth = (2 * settings.oversold - percent_k - percent_d) / (2 * zone) if zone > 0 else 0.0
+    else:
+        direction = -1
+        zone = 100 - settings.overbought
+        depth = (percent_k + percent_d - 2 * settings.overbought) / (2 * zone) if zone > 0 else 0.0
+
+    momentum = 0.0
+    histogram = analysis.get('Histogram')
+    if histogram is not None and close:
+        # 0.05% цены — максимальный вклад
+        momentum = max(-0.5, min(0.5, direction * histogram / close * 1000))
+
+    return 1 + max(0.0, min(1.0, depth)) + momentum
+
+def analyze_candles_batch(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray, settings: Settings) -> Dict[str, np.ndarray]:
+    """
+    Пакетный аналог analyze_candles: анализирует все символы за один проход.
+
+    :param highs: Максимумы формы (символы, свечи), свечи от старых к новым.
+    :param lows: Минимумы формы (символы, свечи).
+    :param closes: Цены закрытия формы (символы, свечи).
+    :param settings: Настройки (периоды индикаторов и зоны перекупленности/перепроданности).
+    :return: Массивы индикаторов по символам и массив сигналов ('long', 'short' или None).
+    """
+    percent_k, percent_d = calculate_stochastic_oscillator_batch(highs, lows, closes, settings.k_period, settings.d_period)
+    macd, signal, histogram = calculate_macd_batch(closes, settings.fast_period, settings.slow_period, settings.signal_period)
+
+    overbought = settings.overbought
+    oversold = settings.oversold
+
+    # Сигналы только при наличии всех индикаторов (сравнения с NaN дают False)
+    complete = ~(np.isnan(percent_k) | np.isnan(percent_d) | np.isnan(macd))
+    signal_long = complete & (percent_k < oversold) & (percent_d < oversold)
+    signal_short = complete & ~signal_long & (percent_k > overbought) & (percent_d > overbought)
+
+    signals = np.full(closes.shape[0], None, dtype=object)
+    signals[signal_long] = 'long'
+    signals[signal_short] = 'short'
+
+    return {
+        '%K': percent_k,
+        '%D': percent_d,
+        'MACD': macd,
+        'Signal': signal,
+        'Histogram': histogram,
+        'signal': signals,
+    }
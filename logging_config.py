@@ -1,27 +1,105 @@
 # logging_config.py
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import multiprocessing
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-def setup_logger(name='telegram_signal_logger', log_file='app.log', level=logging.INFO):
+# Фоновые писатели логов по именам логгеров
+_listeners = {}
+
+class JsonFormatter(logging.Formatter):
+    """
+    Компактный формат JSON lines: одна запись — один объект в строке.
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+def stop_logging(name='telegram_signal_logger'):
+    """
+    Останавливает фоновый писатель логгера, дописывая оставшиеся в очереди записи.
+    """
+    listener = _listeners.pop(name, None)
+    if listener is not None:
+        listener.stop()
+
+def setup_logger(name='telegram_signal_logger', log_file='app.log', level=logging.INFO,
+                 max_bytes=10 * 1024 * 1024, backup_count=5, log_format='text'):
     """
     Настраивает логгер с заданными параметрами.
 
+    Записи передаются через очередь фоновому потоку, который пишет их в файл,
+    поэтому запись на диск и ротация не блокируют цикл событий.
+
     :param name: Имя логгера.
     :param log_file: Путь к лог-файлу.
     :param level: Уровень логирования.
+    :param max_bytes: Размер файла, при котором начинается новый (0 — без ротации).
+    :param backup_count: Количество хранимых старых файлов.
+    :param log_format: Формат записей: text или json (JSON lines).
     :return: Настроенный логгер.
     """
     logger = logging.getLogger(name)
+    stop_logging(name)
     if logger.hasHandlers():
         logger.handlers.clear()
 
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    if log_format == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 
-    # Используем RotatingFileHandler для ротации логов
-    file_handler = RotatingFileHandler(log_file, mode='w')  # Режим 'w' для перезаписи
+    # Используем RotatingFileHandler для ротации логов; запуски дописывают в тот же файл
+    file_handler = RotatingFileHandler(log_file, mode='a', maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
     file_handler.setFormatter(formatter)
 
-    logger.addHandler(file_handler)
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    _listeners[name] = listener
+
+    logger.addHandler(QueueHandler(log_queue))
     logger.setLevel(level)
 
     return logger
+
+def start_worker_log_queue(name='telegram_signal_logger', context=None):
+    """
+    Создаёт очередь, через которую процессы-воркеры передают записи в логгер name
+    основного процесса (в файл пишет только основной процесс).
+
+    :param context: Контекст multiprocessing, в котором создаются воркеры.
+    :return: Очередь для setup_worker_logger.
+    """
+    key = f"{name}:workers"
+    stop_logging(key)
+    log_queue = (context or multiprocessing).Queue()
+    listener = QueueListener(log_queue, *logging.getLogger(name).handlers)
+    listener.start()
+    _listeners[key] = listener
+    return log_queue
+
+def setup_worker_logger(log_queue, name='telegram_signal_logger', level=logging.INFO):
+    """
+    Настраивает логгер в процессе-воркере на передачу записей в основной процесс.
+    """
+    logger = logging.getLogger(name)
+    stop_logging(name)
+    logger.handlers.clear()
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(level)
+    return logger
+
+@atexit.register
+def _stop_all():
+    for name in list(_listeners):
+        stop_logging(name)
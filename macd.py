@@ -1,11 +1,12 @@
 # macd.py
-from typing import List, Dict, Tuple, Optional
+from typing import List, Sequence, Tuple, Optional
+from candles import Candles
 
-def calculate_macd(candles: List[Dict[str, float]], fast_period: int = 12, slow_period: int = 26, signal_period: int = 9) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+def calculate_macd(candles: Candles, fast_period: int = 12, slow_period: int = 26, signal_period: int = 9) -> Tuple[Optional[float], Optional[float], Optional[float]]:
     """
     Рассчитывает MACD, сигнальную линию и гистограмму.
 
-    :param candles: Список свечей (от старых к новым) в формате List[Dict].
+    :param candles: Свечи (от старых к новым).
     :param fast_period: Период быстрой EMA.
     :param slow_period: Период медленной EMA.
     :param signal_period: Период сигнальной линии.
@@ -14,10 +15,10 @@ def calculate_macd(candles: List[Dict[str, float]], fast_period: int = 12, slow_
     if len(candles) < slow_period + signal_period:
         return None, None, None
 
-    closes = [float(candle['close']) for candle in candles]
+    closes = candles.close
 
     # Функция для расчета EMA
-    def calculate_ema(data: List[float], period: int) -> List[Optional[float]]:
+    def calculate_ema(data: Sequence[float], period: int) -> List[Optional[float]]:
         ema = []
         multiplier = 2 / (period + 1)
         for i in range(len(data)):
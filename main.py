@@ -1,228 +1,737 @@
 import asyncio
+import heapq
+import itertools
+import json
+import multiprocessing
 import os
+import signal
 import aiohttp
 import logging
-from datetime import datetime
-from dotenv import load_dotenv
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from functools import partial
+from datetime import datetime, timezone
+from dotenv import find_dotenv, load_dotenv
 from telegram import Bot
-from bybit_api import get_usdt_perpetual_symbols, get_kline_with_retries
-from helpers import analyze_candles
-from messaging import run_message_workers
-from logging_config import setup_logger
+from typing import List, Optional, Tuple
+import bybit_api
+from bybit_api import get_latest_klines, get_kline_cached, get_tickers, get_session, close_session, INTERVAL_MS
+from bybit_ws import KlineStream
+from streaming_indicators import IndicatorRegistry
+from candle_store import CandleStore
+from signal_state import SignalState
+from symbol_registry import SymbolRegistry
+from helpers import signal_strength
+from rules import get_rule_plan
+from config import INTERVAL_MINUTES, Settings, load_settings
+from candles import Candles
+from resample import resample_candles
+from prescreen import MAX_CLOSE_LAG_MS, prescreen_symbols
+from scheduler import prioritize_symbols, run_bounded
+from messaging import run_message_workers, send_telegram_message
+from logging_config import setup_logger, setup_worker_logger, start_worker_log_queue
+from metrics import metrics, start_metrics_server
+
+# Отбор сильнейших сигналов цикла
+class SignalRanking:
+    """
+    Хранит message_limit самых сильных сигналов цикла в min-куче.
 
-# Класс для хранения общего состояния
-class SharedState:
+    Сигналы добавляются по мере обработки символов, поэтому к завершению последнего
+    запроса список лучших уже готов, а лимит отсекает самые слабые сигналы, а не самые медленные ответы.
+    """
     def __init__(self, message_limit):
         self.message_limit = message_limit
-        self.messages_sent = 0
-        self.lock = asyncio.Lock()
-        self.limit_reached_event = asyncio.Event()
-
-# Загрузка переменных окружения
+        self.heap = []
+        self.total = 0
+        self._order = itertools.count()
+
+    def push(self, score: float, message: str, keys: tuple = ()):
+        """
+        :param keys: Ключи сигналов сообщения для SignalState.mark_sent.
+        """
+        self.total += 1
+        # При равной силе сохраняется сигнал, пришедший раньше
+        item = (score, -next(self._order), message, keys)
+        if len(self.heap) < self.message_limit:
+            heapq.heappush(self.heap, item)
+        elif item > self.heap[0]:
+            heapq.heapreplace(self.heap, item)
+
+    def items(self) -> List[Tuple[float, str, tuple]]:
+        """
+        Возвращает отобранные сигналы (сила, сообщение, ключи) для объединения рейтингов.
+        """
+        return [(score, message, keys) for score, _, message, keys in sorted(self.heap, reverse=True)]
+
+    def merge(self, items: List[Tuple[float, str, tuple]], total: int):
+        """
+        Добавляет сигналы, отобранные другим рейтингом из total найденных.
+        """
+        for score, message, keys in items:
+            self.push(score, message, keys)
+        self.total += total - len(items)
+
+    @property
+    def dropped(self) -> int:
+        return self.total - len(self.heap)
+
+    def top(self) -> list:
+        """
+        Возвращает отобранные сообщения от сильного сигнала к слабому.
+        """
+        return [message for _, _, message, _ in sorted(self.heap, reverse=True)]
+
+# Загрузка переменных окружения и настроек
 load_dotenv()
-BOT_TOKEN = os.getenv('BOT_TOKEN')
-CHAT_ID = os.getenv('CHAT_ID')
-MESSAGE_LIMIT = int(os.getenv('MESSAGE_LIMIT', 20))  # Добавлено
+settings = load_settings()
 
-if not BOT_TOKEN or not CHAT_ID:
-    raise ValueError("BOT_TOKEN и CHAT_ID должны быть установлены в .env файле.")
+def get_resampled_intervals(intervals, base_interval: Optional[str]) -> list:
+    """
+    Возвращает интервалы, которые рассчитываются из свечей базового интервала.
+    """
+    if not base_interval:
+        return []
+    base_minutes = INTERVAL_MINUTES[base_interval]
+    return [
+        key for key in intervals
+        if INTERVAL_MINUTES[key] > base_minutes and INTERVAL_MINUTES[key] % base_minutes == 0
+    ]
+
+def get_resample_limit(settings: Settings, intervals=None) -> int:
+    """
+    Возвращает количество свечей базового интервала, достаточное для kline_limit свечей
+    каждого старшего интервала (с запасом на неполную первую свечу).
 
-logger = setup_logger(log_file='app.log', level=logging.INFO)
-bot = Bot(token=BOT_TOKEN)
+    :param intervals: Интервалы цикла (по умолчанию все настроенные): загружается
+                      ровно столько базовых свечей, сколько нужно анализируемым интервалам.
+    """
+    if not settings.resample_base_interval:
+        return settings.kline_limit
+    base_minutes = INTERVAL_MINUTES[settings.resample_base_interval]
+    ratios = [
+        INTERVAL_MINUTES[key] // base_minutes
+        for key in get_resampled_intervals(settings.intervals if intervals is None else intervals,
+                                           settings.resample_base_interval)
+    ]
+    return max(ratios, default=1) * (settings.kline_limit + 1) + 1
+
+logger = setup_logger(log_file='app.log', level=logging.INFO,
+                      max_bytes=settings.log_max_bytes, backup_count=settings.log_backup_count,
+                      log_format=settings.log_format)
+bot = Bot(token=settings.bot_token)
+candle_store = (
+    CandleStore(settings.candle_store_path, max_history=max(1000, get_resample_limit(settings)))
+    if settings.candle_store_path else None
+)
+signal_state = SignalState(settings.signal_state_path) if settings.signal_state_path else None
+symbol_registry = SymbolRegistry(settings.symbols_cache_path, ttl=settings.symbols_refresh_seconds, logger=logger)
+
+async def fetch_closed_candles(session: aiohttp.ClientSession, symbol: str, interval: str, limit: int,
+                               kline_stream: Optional[KlineStream] = None) -> Candles:
+    """
+    Возвращает до limit - 1 последних закрытых свечей из WebSocket-потока,
+    локального хранилища или REST (пустые Candles при ошибке).
+    """
+    if kline_stream is not None and kline_stream.is_fresh(symbol, interval):
+        # В WebSocket-потоке хранятся только закрытые свечи, уже разобранные в колонки
+        candles = kline_stream.get_candles(symbol, interval, limit - 1)
+        if len(candles) >= limit - 1:
+            return candles
+
+    if candle_store is not None:
+        # Догружаем с биржи только новые свечи
+        kline_data = await get_kline_cached(session, candle_store, symbol, interval, limit=limit)
+        candles = Candles.from_rows(kline_data or [])
+    else:
+        # Ответ REST разбирается сразу в колонки
+        candles = await get_latest_klines(session, symbol, interval, limit, columns=True) or Candles()
+    return candles[:-1]  # Исключаем последнюю свечу
 
 async def process_symbol(symbol: str, intervals: dict, session: aiohttp.ClientSession,
-                         semaphore: asyncio.Semaphore, message_queue: asyncio.Queue,
-                         shared_state: SharedState):
+                         ranking: SignalRanking, settings: Settings, kline_stream: Optional[KlineStream] = None):
     """
     Обрабатывает символ на указанных интервалах и объединяет сигналы для одного символа.
+
+    Если передан kline_stream и в нём есть актуальные свечи, REST-запрос не выполняется,
+    а индикаторы берутся из потокового состояния (EMA по всей истории потока, а не по окну свечей).
+    При заданном RESAMPLE_BASE_INTERVAL старшие интервалы строятся из свечей базового
+    без дополнительных запросов. Индикаторы проверяются планом правил (rules.py) и считаются
+    только по мере необходимости. Найденный сигнал передаётся в ranking с оценкой силы.
     """
-    async with semaphore:
-        if shared_state.limit_reached_event.is_set():
-            # Достигнут лимит сообщений, пропускаем обработку
-            return
+    base_interval = settings.resample_base_interval
+    resampled = get_resampled_intervals(intervals, base_interval)
+    kline_limit = settings.kline_limit
+    rule_plan = get_rule_plan(settings)
+    signals = {}  # Для хранения сигналов
+    base_candles = None
+    for interval_key, interval_value in intervals.items():
+        try:
+            if resampled and (interval_key in resampled or interval_key == base_interval):
+                # Свечи базового интервала загружаются один раз на символ
+                if base_candles is None:
+                    with metrics.timer('fetch'):
+                        base_candles = await fetch_closed_candles(session, symbol, base_interval, get_resample_limit(settings, intervals), kline_stream)
+                candles = base_candles
+                if interval_key != base_interval:
+                    with metrics.timer('resample'):
+                        candles = resample_candles(base_candles, INTERVAL_MS[base_interval], INTERVAL_MS[interval_key])
+                candles = candles[-(kline_limit - 1):]
+            else:
+                with metrics.timer('fetch'):
+                    candles = await fetch_closed_candles(session, symbol, interval_key, kline_limit, kline_stream)
+            if not candles:
+                logger.warning("Нет данных свечей для %s на интервале %s.", symbol, interval_value)
+                continue
 
-        signals = {}  # Для хранения сигналов
-        for interval_key, interval_value in intervals.items():
-            if shared_state.limit_reached_event.is_set():
-                # Достигнут лимит сообщений, пропускаем обработку
+            # Потоковые значения есть только для подписанных интервалов и только для последней свечи
+            stream_values = kline_stream.get_indicators(symbol, interval_key, candles.start[-1]) if kline_stream is not None else None
+            with metrics.timer('indicators'):
+                passed, analysis = rule_plan.evaluate(candles, settings, stream_values)
+            if passed is None:
+                logger.warning("%s | %s | Недостаточно данных для индикаторов", symbol, interval_value)
+                continue
+            if not passed:
+                # Символ не прошёл фильтр (SIGNAL_GATE) — дальнейшие интервалы не проверяются
                 return
 
-            try:
-                # Увеличено количество свечей для расчета MACD (26 + 9 = 35)
-                kline_data = await get_kline_with_retries(session, symbol, interval_key, limit=36)
-                if not kline_data:
-                    logger.warning(f"Нет данных свечей для {symbol} на интервале {interval_value}.")
-                    continue
-
-                fields = ['start', 'open', 'high', 'low', 'close', 'volume']
-                candles = [dict(zip(fields, candle)) for candle in kline_data[:-1]]  # Исключаем последнюю свечу
-
-                analysis = analyze_candles(candles)
-
-                signal = analysis.get('signal')
-                percent_k = analysis.get('%K')
-                percent_d = analysis.get('%D')
-                macd = analysis.get('MACD')
-                if percent_k > 10: return
-                if macd < 0: return
+            signal = analysis.get('signal')
+            percent_k = analysis.get('%K')
+            percent_d = analysis.get('%D')
+            macd = analysis.get('MACD')
 
-                # Логируем значения индикаторов
-                if percent_k is not None and percent_d is not None and macd is not None:
-                    logger.info(f"{symbol} | {interval_value} | %K: {percent_k:.5f} | %D: {percent_d:.5f} | MACD: {macd:.7f}")
+            # Логируем значения индикаторов
+            if percent_k is not None and percent_d is not None and macd is not None:
+                logger.info("%s | %s | %%K: %.5f | %%D: %.5f | MACD: %.7f", symbol, interval_value, percent_k, percent_d, macd)
+            else:
+                logger.warning("%s | %s | Недостаточно данных для индикаторов", symbol, interval_value)
+
+            # Отправка сигналов только если все индикаторы присутствуют и являются числами
+            if signal and isinstance(percent_k, (float, int)) and isinstance(percent_d, (float, int)) and isinstance(macd, (float, int)):
+                trade_action = "🔴 SHORT" if signal == "short" else "🟢 LONG"
+
+                # Повтор сигнала, который держится с прошлой отправки, не отправляется снова
+                fresh = signal_state is None or signal_state.observe(
+                    symbol, interval_key, signal, candles.start[-1], INTERVAL_MS[interval_key],
+                    settings.signal_cooldown_minutes * 60_000,
+                )
+
+                # Инициализация списка сигналов для символа
+                if symbol not in signals:
+                    signals[symbol] = {
+                        'intervals': [],
+                        'trade_action': trade_action,
+                        'percent_k': percent_k,
+                        'percent_d': percent_d,
+                        'macd': macd,
+                        'score': 0.0,
+                        'fresh': False,
+                        'keys': []
+                    }
                 else:
-                    logger.warning(f"{symbol} | {interval_value} | Недостаточно данных для индикаторов")
-
-                # Отправка сигналов только если все индикаторы присутствуют и являются числами
-                if signal and isinstance(percent_k, (float, int)) and isinstance(percent_d, (float, int)) and isinstance(macd, (float, int)):
-                    trade_action = "🔴 SHORT" if signal == "short" else "🟢 LONG"
-
-                    # Инициализация списка сигналов для символа
-                    if symbol not in signals:
-                        signals[symbol] = {
-                            'intervals': [],
-                            'trade_action': trade_action,
-                            'percent_k': percent_k,
-                            'percent_d': percent_d,
-                            'macd': macd
-                        }
-                    else:
-                        # Обновляем последние значения
-                        signals[symbol]['percent_k'] = percent_k
-                        signals[symbol]['percent_d'] = percent_d
-                        signals[symbol]['macd'] = macd
-
-                    signals[symbol]['intervals'].append(interval_value)
-
-            except aiohttp.ClientResponseError as e:
-                logger.error(f"Ошибка при получении данных свечей для {symbol}: {e.status}, {e.message}, URL: {e.request_info.url}")
-            except aiohttp.ContentTypeError as e:
-                logger.error(f"Неверный тип содержимого при получении данных для {symbol}: {e}")
-            except Exception as e:
-                logger.error(f"Ошибка при обработке символа {symbol} на интервале {interval_value}: {e}")
-
-        # Формируем сообщение для символа, если есть сигналы
-        for symbol, data in signals.items():
-            if shared_state.limit_reached_event.is_set():
-                # Достигнут лимит сообщений, пропускаем обработку
-                return
-
-            intervals_text = ", ".join(data['intervals'])
-            trade_action = data['trade_action']
-            percent_k = data.get('percent_k')
-            percent_d = data.get('percent_d')
-            macd = data.get('macd')
-
-            # Проверяем, что значения числовые перед форматированием
-            if not (isinstance(percent_k, (float, int)) and isinstance(percent_d, (float, int)) and isinstance(macd, (float, int))):
-                logger.warning(f"Не все индикаторы числовые для {symbol} на интервале {intervals_text}. Сообщение не будет отправлено.")
-                continue
+                    # Обновляем последние значения
+                    signals[symbol]['percent_k'] = percent_k
+                    signals[symbol]['percent_d'] = percent_d
+                    signals[symbol]['macd'] = macd
+
+                signals[symbol]['intervals'].append(interval_value)
+                signals[symbol]['fresh'] = signals[symbol]['fresh'] or fresh
+                signals[symbol]['keys'].append((symbol, interval_key, signal, candles.start[-1]))
+                signals[symbol]['score'] += signal_strength(analysis, candles.close[-1], settings)
+
+        except aiohttp.ClientResponseError as e:
+            logger.error("Ошибка при получении данных свечей для %s: %s, %s, URL: %s", symbol, e.status, e.message, e.request_info.url)
+        except aiohttp.ContentTypeError as e:
+            logger.error("Неверный тип содержимого при получении данных для %s: %s", symbol, e)
+        except Exception as e:
+            logger.error("Ошибка при обработке символа %s на интервале %s: %s", symbol, interval_value, e)
+
+    # Формируем сообщение для символа, если есть сигналы
+    for symbol, data in signals.items():
+        intervals_text = ", ".join(data['intervals'])
+        if not data['fresh']:
+            metrics.inc('repeat_signals')
+            logger.info("%s | %s | Сигнал уже отправлен, повтор пропущен", symbol, intervals_text)
+            continue
+
+        trade_action = data['trade_action']
+        percent_k = data.get('percent_k')
+        percent_d = data.get('percent_d')
+        macd = data.get('macd')
+
+        # Проверяем, что значения числовые перед форматированием
+        if not (isinstance(percent_k, (float, int)) and isinstance(percent_d, (float, int)) and isinstance(macd, (float, int))):
+            logger.warning("Не все индикаторы числовые для %s на интервале %s. Сообщение не будет отправлено.", symbol, intervals_text)
+            continue
+
+        percent_k_formatted = f"{percent_k:.5f}"
+        percent_d_formatted = f"{percent_d:.5f}"
+        macd_formatted = f"{macd:.7f}"
+
+        message = (
+            f"🔥 #{symbol}\n"
+            f"🕒 {intervals_text}\n"
+            f"{trade_action}\n"
+            f"%K: {percent_k_formatted}\n"
+            f"%D: {percent_d_formatted}\n"
+            f"MACD: {macd_formatted}\n"
+        )
 
-            percent_k_formatted = f"{percent_k:.5f}"
-            percent_d_formatted = f"{percent_d:.5f}"
-            macd_formatted = f"{macd:.7f}"
-
-            message = (
-                f"🔥 #{symbol}\n"
-                f"🕒 {intervals_text}\n"
-                f"{trade_action}\n"
-                f"%K: {percent_k_formatted}\n"
-                f"%D: {percent_d_formatted}\n"
-                f"MACD: {macd_formatted}\n"
-            )
-
-            # Попытка увеличить счётчик сообщений
-            async with shared_state.lock:
-                if shared_state.messages_sent >= shared_state.message_limit:
-                    shared_state.limit_reached_event.set()
-                    logger.info("Достигнут лимит сообщений. Остановка дальнейшей обработки.")
-                    return
-                shared_state.messages_sent += 1
-
-            await message_queue.put(message)
+        ranking.push(data['score'], message, tuple(data['keys']))
 
-async def main():
+def select_intervals(current_time: datetime, is_manual_run: bool, intervals: dict) -> dict:
     """
-    Главная функция.
+    Определяет интервалы для анализа на основе времени запуска.
+
+    :param current_time: Время запуска (момент закрытия свечи) в UTC: свечи Bybit закрываются
+                         по UTC, а не по местному времени сервера.
+    :param is_manual_run: Ручной запуск — анализируются все интервалы.
+    :param intervals: Настроенные интервалы {ключ Bybit: название}.
+    :return: Словарь интервалов {ключ Bybit: название}.
     """
-    is_manual_run = os.getenv("MANUAL_RUN", "false").lower() == "true"
-    current_time = datetime.now()
     current_minute = current_time.minute
     current_hour = current_time.hour
-    current_day = current_time.day  # Добавлено, если потребуется
-
-    # Определяем интервалы на основе текущего времени
-    intervals = {
-        # '1': '1m',
-        # '5': '5m',
-        '15': '15m',
-        # '30': '30m',
-        # '60': '1h',
-        # '240': '4h',    # Добавлено
-        # '720': '12h',   # Добавлено
-        # 'D': '1d'    # Добавлено
-    }
+
+    intervals = dict(intervals)
+    if is_manual_run:
+        return intervals
 
     # Фильтруем интервалы на основе времени запуска
-    if not is_manual_run:  # Если скрипт не запущен вручную
-        if current_minute % 60 == 0:
-            if current_hour % 12 == 0 and current_minute == 0:
-                # Время для дневного и 12-часового интервала
-                intervals = {k: v for k, v in intervals.items() if k in ['5', '15', '30', '60', '240', '720', '1440']}
-            elif current_hour % 4 == 0 and current_minute == 0:
-                # Время для 4-часового интервала
-                intervals = {k: v for k, v in intervals.items() if k in ['5', '15', '30', '60', '240']}
-            else:
-                intervals = {k: v for k, v in intervals.items() if k in ['5', '15', '30', '60']}
-        elif current_minute % 30 == 0:
-            intervals = {k: v for k, v in intervals.items() if k in ['5', '15', '30']}
-        elif current_minute % 15 == 0:
-            intervals = {k: v for k, v in intervals.items() if k in ['5', '15']}
-        elif current_minute % 5 == 0:
-            intervals = {k: v for k, v in intervals.items() if k in ['5']}
+    if current_minute % 60 == 0:
+        if current_hour == 0 and current_minute == 0:
+            # Время для дневного и 12-часового интервала
+            intervals = {k: v for k, v in intervals.items() if k in ['5', '15', '30', '60', '240', '720', 'D']}
+        elif current_hour % 12 == 0 and current_minute == 0:
+            # Время для 12-часового интервала (дневная свеча ещё не закрыта)
+            intervals = {k: v for k, v in intervals.items() if k in ['5', '15', '30', '60', '240', '720']}
+        elif current_hour % 4 == 0 and current_minute == 0:
+            # Время для 4-часового интервала
+            intervals = {k: v for k, v in intervals.items() if k in ['5', '15', '30', '60', '240']}
         else:
-            intervals = {k: v for k, v in intervals.items() if k in ['1']}
-            logger.info("Запуск скрипта с 1-минутным интервалом.")
-            return
+            intervals = {k: v for k, v in intervals.items() if k in ['5', '15', '30', '60']}
+    elif current_minute % 30 == 0:
+        intervals = {k: v for k, v in intervals.items() if k in ['5', '15', '30']}
+    elif current_minute % 15 == 0:
+        intervals = {k: v for k, v in intervals.items() if k in ['5', '15']}
+    elif current_minute % 5 == 0:
+        intervals = {k: v for k, v in intervals.items() if k in ['5']}
+    else:
+        intervals = {k: v for k, v in intervals.items() if k in ['1']}
+        logger.info("Запуск скрипта с 1-минутным интервалом.")
+        return {}
+
+    return intervals
+
+async def load_symbols(session: aiohttp.ClientSession, settings: Settings):
+    """
+    Возвращает список USDT бессрочных контрактов для анализа из кэша символов.
+    """
+    with metrics.timer('symbols'):
+        symbols = await symbol_registry.get_symbols(session)
+    return [symbol for symbol in symbols if symbol.upper() not in settings.excluded_symbols]
 
-    # Ограничение количества одновременных задач
-    MAX_CONCURRENT_TASKS = 50
-    MAX_WORKERS = 5  # Количество воркеров для отправки сообщений
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
+def load_stored_history(symbol: str, interval: str, settings: Settings) -> Optional[Tuple[Candles, int]]:
+    """
+    Возвращает сохранённые закрытые свечи до только что закрытой свечи интервала
+    и время её открытия, если история в хранилище непрерывна до неё и её последняя
+    свеча сохранена уже закрытой.
+    """
+    if candle_store is None or interval in get_resampled_intervals(settings.intervals, settings.resample_base_interval):
+        return None
+    interval_ms = INTERVAL_MS[interval]
+    now = int(time.time() * 1000)
+    current_start = now // interval_ms * interval_ms
+    if now - current_start > MAX_CLOSE_LAG_MS:
+        return None
+    start = current_start - interval_ms
+    # Свеча start на момент прошлого сохранения ещё не была закрыта — её значения не используются
+    rows = [row for row in candle_store.load(symbol, interval, settings.kline_limit + 1) if row[0] < start]
+    if not rows or rows[-1][0] != start - interval_ms:
+        return None
+    # Предыдущая свеча годится, только если сохранена после своего закрытия: если символ
+    # был отсеян в прошлом цикле, в хранилище остался её незакрытый снимок
+    saved_at = candle_store.saved_at(symbol, interval, rows[-1][0])
+    if saved_at is None or saved_at < start:
+        return None
+    return Candles.from_rows(rows), start
+
+def prescreen(symbols: list, tickers: dict, intervals: dict, settings: Settings) -> list:
+    """
+    Отбирает символы для полной проверки по тикерам и сохранённым свечам.
+    """
+    with metrics.timer('prescreen'):
+        load_history = partial(load_stored_history, settings=settings) if candle_store is not None else None
+        shortlist = prescreen_symbols(symbols, tickers, intervals, settings, load_history)
+    metrics.inc('prescreened_out', len(symbols) - len(shortlist))
+    logger.info("Предварительный отбор: к проверке %d из %d символов.", len(shortlist), len(symbols))
+    return shortlist
+
+# Пул процессов сканирования (SCAN_PROCESSES > 1), живёт между циклами демона
+shard_pool: Optional[ProcessPoolExecutor] = None
+shard_pool_size = 0
+
+def init_shard_worker(log_queue, processes: int):
+    """
+    Инициализирует процесс-воркер: логи передаются в основной процесс,
+    лимит запросов к Bybit делится между процессами.
+    """
+    setup_worker_logger(log_queue)
+    bybit_api.rate_limiter = bybit_api.RateLimiter(
+        bybit_api.RATE_LIMIT_RPS / processes,
+        max(1, bybit_api.RATE_LIMIT_BURST // processes),
+    )
+
+async def scan_symbols(symbols: list, intervals: dict, session: aiohttp.ClientSession, ranking: SignalRanking,
+                       settings: Settings, kline_stream: Optional[KlineStream] = None,
+                       deadline: Optional[float] = None) -> list:
+    """
+    Сканирует символы в порядке приоритета пулом из MAX_CONCURRENT_TASKS воркеров.
+    При наступлении deadline незавершённые запросы отменяются.
+
+    :return: Символы, которые не успели обработать.
+    """
+    return await run_bounded(
+        symbols,
+        lambda symbol: process_symbol(symbol, intervals, session, ranking, settings, kline_stream),
+        settings.max_concurrent_tasks,
+        deadline,
+        logger,
+    )
+
+async def scan_shard_symbols(symbols: list, intervals: dict, settings: Settings,
+                             deadline: Optional[float]) -> Tuple[List[Tuple[float, str, tuple]], int, list]:
+    """
+    Сканирует часть символов в процессе-воркере со своим циклом событий и HTTP-сессией.
+    """
+    session = get_session()
+    try:
+        ranking = SignalRanking(message_limit=settings.message_limit)
+        skipped = await scan_symbols(symbols, intervals, session, ranking, settings, deadline=deadline)
+        return ranking.items(), ranking.total, skipped
+    finally:
+        await close_session()
+
+def scan_shard(symbols: list, intervals: dict, settings: Settings,
+               deadline: Optional[float] = None) -> Tuple[List[Tuple[float, str, tuple]], int, list, dict]:
+    """
+    Точка входа процесса-воркера: возвращает отобранные сигналы части символов,
+    количество найденных сигналов, необработанные символы и замеры этапов.
+    """
+    items, total, skipped = asyncio.run(scan_shard_symbols(symbols, intervals, settings, deadline))
+    return items, total, skipped, metrics.snapshot()
+
+def get_shard_pool(processes: int) -> ProcessPoolExecutor:
+    """
+    Возвращает пул процессов сканирования, создавая его при первом обращении
+    или при изменении количества процессов.
+    """
+    global shard_pool, shard_pool_size
+    if shard_pool is None or shard_pool_size != processes:
+        close_shard_pool()
+        # spawn: воркеры не наследуют цикл событий, сессию и потоки основного процесса
+        context = multiprocessing.get_context('spawn')
+        shard_pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=context,
+            initializer=init_shard_worker,
+            initargs=(start_worker_log_queue(context=context), processes),
+        )
+        shard_pool_size = processes
+    return shard_pool
+
+def close_shard_pool():
+    global shard_pool
+    if shard_pool is not None:
+        shard_pool.shutdown()
+        shard_pool = None
+
+async def scan_sharded(symbols: list, intervals: dict, settings: Settings, ranking: SignalRanking,
+                       deadline: Optional[float] = None) -> list:
+    """
+    Делит символы между процессами сканирования и объединяет их рейтинги в ranking.
+
+    :return: Символы, которые процессы не успели обработать до deadline.
+    """
+    processes = min(settings.scan_processes, len(symbols))
+    pool = get_shard_pool(settings.scan_processes)
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(pool, scan_shard, symbols[shard::processes], intervals, settings, deadline)
+        for shard in range(processes)
+    ))
+    skipped = []
+    for items, total, shard_skipped, shard_metrics in results:
+        ranking.merge(items, total)
+        metrics.merge(shard_metrics)
+        skipped.extend(shard_skipped)
+    return skipped
+
+def cycle_deadline(settings: Settings, now: float) -> float:
+    """
+    Возвращает крайний срок сканирования: до начала следующего цикла демона
+    (закрытие ближайшей свечи + DAEMON_CLOSE_DELAY) с запасом SCAN_DEADLINE_MARGIN на отправку.
+    """
+    step_seconds = min(INTERVAL_MINUTES[k] for k in settings.intervals) * 60
+    return now + seconds_until_next_close(step_seconds, now) + settings.daemon_close_delay - settings.scan_deadline_margin
+
+async def run_cycle(bot: Bot, session: aiohttp.ClientSession, symbols: list, intervals: dict,
+                    settings: Settings, kline_stream: Optional[KlineStream] = None,
+                    deadline: Optional[float] = None):
+    """
+    Выполняет один цикл анализа всех символов и отправку сигналов.
+
+    :param bot: Экземпляр бота Telegram.
+    :param session: HTTP-сессия для запросов к Bybit.
+    :param symbols: Список символов.
+    :param intervals: Интервалы для анализа.
+    :param settings: Настройки цикла.
+    :param kline_stream: WebSocket-поток свечей (режим демона с KLINE_FEED=ws).
+    :param deadline: Крайний срок сканирования (Unix timestamp): необработанные к нему
+                     символы пропускаются, найденные сигналы отправляются.
+    """
+    started = time.perf_counter()
     message_queue = asyncio.Queue()
 
-    shared_state = SharedState(message_limit=MESSAGE_LIMIT)
+    ranking = SignalRanking(message_limit=settings.message_limit)
+
+    # Запускаем отправку сигналов сводными сообщениями
+    worker_task = asyncio.create_task(
+        run_message_workers(
+            bot,
+            settings.chat_id,
+            message_queue,
+            logger,
+            rate=settings.telegram_rate,
+            burst=settings.telegram_burst,
+            linger=settings.digest_linger
+        )
+    )
+
+    tickers = None
+    if kline_stream is None:
+        # Один запрос тикеров: предварительный отбор и порядок сканирования по обороту
+        with metrics.timer('tickers'):
+            tickers = await get_tickers(session)
+        if not tickers:
+            logger.warning("Тикеры недоступны: предварительный отбор и сортировка по обороту пропущены.")
+        elif settings.prescreen and (candle_store is not None or settings.min_turnover_24h > 0):
+            # Без хранилища отбор возможен только по обороту; при WebSocket-потоке свечи уже в памяти
+            symbols = prescreen(symbols, tickers, intervals, settings)
+
+    # Сначала символы с продолжающимися сигналами, затем самые ликвидные
+    symbols = prioritize_symbols(
+        symbols,
+        {symbol: ticker['turnover24h'] for symbol, ticker in (tickers or {}).items()},
+        signal_state.active_symbols() if signal_state is not None else (),
+    )
+
+    if settings.scan_processes > 1 and kline_stream is None and len(symbols) > 1:
+        skipped = await scan_sharded(symbols, intervals, settings, ranking, deadline)
+    else:
+        skipped = await scan_symbols(symbols, intervals, session, ranking, settings, kline_stream, deadline)
+    metrics.observe('scan', time.perf_counter() - started)
+    if skipped:
+        metrics.inc('deadline_skipped', len(skipped))
+        logger.warning("Сканирование прервано по крайнему сроку: не обработано %d из %d символов.", len(skipped), len(symbols))
+    metrics.inc('signals', ranking.total)
+    metrics.inc('dropped_signals', ranking.dropped)
+
+    if ranking.dropped:
+        logger.info("Отобрано %d сильнейших сигналов из %d, отброшено %d.", len(ranking.heap), ranking.total, ranking.dropped)
+    for _, message, keys in ranking.items():
+        await message_queue.put((message, keys))
+
+    # Завершаем очередь сообщений: накопленные сигналы будут отправлены до выхода
+    await message_queue.put("EXIT")
+    delivered = await worker_task
+    if signal_state is not None:
+        # Недоставленные сигналы не считаются отправленными и будут отправлены в следующем цикле
+        signal_state.mark_sent(delivered)
+        signal_state.evict(int(time.time() * 1000))
+
+    metrics.observe('cycle', time.perf_counter() - started)
+    cycle_metrics = metrics.finish_cycle()
+    logger.info("Метрики цикла: %s", json.dumps(cycle_metrics, ensure_ascii=False))
+
+async def main():
+    """
+    Главная функция: однократный запуск (вручную или внешним планировщиком).
+    """
+    is_manual_run = os.getenv("MANUAL_RUN", "false").lower() == "true"
+
+    intervals = select_intervals(datetime.now(timezone.utc), is_manual_run, settings.intervals)
+    if not intervals:
+        return
 
-    async with aiohttp.ClientSession() as session:
-        symbols = await get_usdt_perpetual_symbols()
-        symbols = [symbol for symbol in symbols if symbol.upper() != 'USDCUSDT']
+    session = get_session()
+    try:
+        symbols = await load_symbols(session, settings)
         # logger.info(f"Доступные символы для USDT бессрочных контрактов: {symbols}")
 
         if not symbols:
-            await send_telegram_message(bot, CHAT_ID, "❌ Список символов пуст.", logger)
+            await send_telegram_message(bot, settings.chat_id, "❌ Список символов пуст.", logger)
             return
 
-        # Запускаем обработчик сообщений с несколькими воркерами
-        worker_task = asyncio.create_task(
-            run_message_workers(
-                bot,
-                CHAT_ID,
-                message_queue,
-                logger,
-                max_workers=MAX_WORKERS
-            )
-        )
+        # Запуск по расписанию должен уложиться в интервал, ручной — без ограничения
+        deadline = None if is_manual_run else cycle_deadline(settings, time.time())
+        await run_cycle(bot, session, symbols, intervals, settings, deadline=deadline)
+    finally:
+        close_shard_pool()
+        await symbol_registry.close()
+        await close_session()
 
-        tasks = [
-            process_symbol(symbol, intervals, session, semaphore, message_queue, shared_state)
-            for symbol in symbols
-        ]
+def seconds_until_next_close(step_seconds: int, now: float) -> float:
+    """
+    Возвращает количество секунд до ближайшего закрытия свечи.
 
-        await asyncio.gather(*tasks)
+    :param step_seconds: Длительность наименьшего интервала в секундах.
+    :param now: Текущее время (Unix timestamp).
+    """
+    next_close = (now // step_seconds + 1) * step_seconds
+    return next_close - now
+
+# Настройки, которые применяются только при перезапуске: от них зависят бот, хранилища,
+# подписки WebSocket, логгер и сервер метрик, созданные при старте
+RESTART_ONLY_SETTINGS = (
+    'bot_token', 'kline_feed', 'candle_store_path', 'symbols_cache_path', 'signal_state_path', 'resample_base_interval',
+    'log_max_bytes', 'log_backup_count', 'log_format', 'metrics_host', 'metrics_port',
+)
+
+def get_env_mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+def reload_settings(current: Settings, env_path: str) -> Settings:
+    """
+    Перечитывает .env и возвращает новые настройки.
+    При ошибке проверки продолжают действовать текущие настройки.
+    """
+    load_dotenv(env_path, override=True)
+    try:
+        new_settings = load_settings()
+    except ValueError as e:
+        logger.error("Настройки не применены: %s", e)
+        return current
+
+    changed = [name for name in current.__dataclass_fields__ if getattr(current, name) != getattr(new_settings, name)]
+    pending = [name for name in changed if name in RESTART_ONLY_SETTINGS]
+    if pending:
+        logger.warning("Изменения %s вступят в силу после перезапуска.", pending)
+        new_settings = replace(new_settings, **{name: getattr(current, name) for name in pending})
+    applied = [name for name in changed if name not in RESTART_ONLY_SETTINGS]
+    if applied:
+        logger.info("Настройки обновлены: %s", applied)
+    return new_settings
+
+def create_indicator_registry(settings: Settings) -> IndicatorRegistry:
+    """
+    Создаёт реестр потоковых индикаторов с периодами из настроек.
+    """
+    return IndicatorRegistry(settings.k_period, settings.d_period,
+                             settings.fast_period, settings.slow_period, settings.signal_period)
+
+async def run_daemon():
+    """
+    Резидентный режим: один процесс, один бот и одна HTTP-сессия на все циклы.
+    Планировщик просыпается на границах закрытия свечей.
+    Настройки перечитываются из .env при его изменении или по сигналу SIGHUP.
+    """
+    current = settings
+    symbols = []
+    kline_stream = None
+    stream_task = None
+    metrics_server = None
+
+    env_path = find_dotenv(usecwd=True) or '.env'
+    env_mtime = get_env_mtime(env_path)
+    reload_requested = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_requested.set)
+    except (NotImplementedError, AttributeError):
+        # SIGHUP недоступен (Windows) — остаётся проверка времени изменения .env
+        pass
+
+    logger.info("Запуск в режиме демона. Интервалы: %s.", list(current.intervals))
+
+    async with bot:
+        session = get_session()
+        try:
+            if current.metrics_port:
+                metrics_server = await start_metrics_server(current.metrics_host, current.metrics_port)
+                logger.info("Метрики доступны на http://%s:%d/metrics", current.metrics_host, current.metrics_port)
+
+            if current.kline_feed == 'ws':
+                # Подписка на свечи до первого цикла, чтобы к закрытию свечи данные уже были в памяти
+                symbols = await load_symbols(session, current)
+                # При пересчёте старших интервалов достаточно подписки на базовый
+                base_interval = current.resample_base_interval
+                resampled = get_resampled_intervals(current.intervals, base_interval)
+                stream_intervals = [key for key in current.intervals if key not in resampled]
+                if base_interval and base_interval not in stream_intervals:
+                    stream_intervals.append(base_interval)
+                # Длинная история нужна только базовому интервалу, из которого строятся старшие
+                history = {key: current.kline_limit - 1 for key in stream_intervals}
+                if resampled:
+                    history[base_interval] = max(history[base_interval], get_resample_limit(current) - 1)
+                kline_stream = KlineStream(session, symbols, stream_intervals, history=history,
+                                           indicators=create_indicator_registry(current), logger=logger)
+                stream_task = asyncio.create_task(kline_stream.run())
+
+            while True:
+                step_seconds = min(INTERVAL_MINUTES[k] for k in current.intervals) * 60
+                delay = seconds_until_next_close(step_seconds, time.time()) + current.daemon_close_delay
+                await asyncio.sleep(delay)
+
+                mtime = get_env_mtime(env_path)
+                if reload_requested.is_set() or mtime != env_mtime:
+                    reload_requested.clear()
+                    env_mtime = mtime
+                    current = reload_settings(current, env_path)
+                    symbol_registry.ttl = current.symbols_refresh_seconds
+                    if kline_stream is not None:
+                        indicators = create_indicator_registry(current)
+                        if indicators.periods != kline_stream.indicators.periods:
+                            # Новые состояния строятся по сохранённым свечам на следующей свече каждой пары,
+                            # до этого индикаторы считаются по окну свечей
+                            kline_stream.indicators = indicators
+
+                intervals = select_intervals(datetime.now(timezone.utc), is_manual_run=False, intervals=current.intervals)
+                if not intervals:
+                    continue
 
-        # Завершаем очередь сообщений, отправляя "EXIT" для каждого воркера
-        for _ in range(MAX_WORKERS):
-            await message_queue.put("EXIT")
-        await worker_task
+                try:
+                    # Список символов кэшируется и обновляется в фоне по истечении TTL
+                    loaded = await load_symbols(session, current)
+                    if loaded and loaded != symbols:
+                        symbols = loaded
+                        if kline_stream is not None:
+                            await kline_stream.update_symbols(symbols)
+
+                    if not symbols:
+                        await send_telegram_message(bot, current.chat_id, "❌ Список символов пуст.", logger)
+                        continue
+
+                    started = time.monotonic()
+                    await run_cycle(bot, session, symbols, intervals, current, kline_stream,
+                                    deadline=cycle_deadline(current, time.time()))
+                    logger.info("Цикл завершён за %.2f сек.", time.monotonic() - started)
+                except Exception as e:
+                    logger.exception("Ошибка в цикле демона: %s", e)
+        finally:
+            if kline_stream is not None:
+                await kline_stream.close()
+                stream_task.cancel()
+            close_shard_pool()
+            if metrics_server is not None:
+                await metrics_server.cleanup()
+            await symbol_registry.close()
+            await close_session()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if os.getenv("DAEMON_MODE", "false").lower() == "true":
+        asyncio.run(run_daemon())
+    else:
+        asyncio.run(main())
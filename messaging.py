@@ -1,10 +1,66 @@
 import asyncio
 import logging
+import time
+from typing import Dict, List, Optional, Tuple
 from telegram import Bot
 from telegram.error import TelegramError, RetryAfter, TimedOut
+from metrics import metrics
+from rate_limit import TokenBucket
 from utils import escape_markdown
 
-async def send_telegram_message(bot: Bot, chat_id: str, message: str, logger: logging.Logger, max_attempts: int = 5, initial_delay: float = 1.0, backoff_factor: float = 2.0):
+# Максимальная длина сообщения Telegram (после экранирования MarkdownV2)
+TELEGRAM_MAX_LENGTH = 4096
+# Разделитель сигналов в сводном сообщении
+DIGEST_SEPARATOR = "\n"
+
+class ChatRateLimiter(TokenBucket):
+    """
+    Ограничитель частоты отправки сообщений в один чат (token bucket).
+
+    Telegram допускает около 1 сообщения в секунду в личный чат и 20 в минуту в группу;
+    при RetryAfter отправка в чат приостанавливается на указанное время (block).
+    """
+
+    def __init__(self, rate: float = 1.0, burst: int = 3):
+        """
+        :param rate: Скорость пополнения, сообщений в секунду.
+        :param burst: Ёмкость корзины.
+        """
+        super().__init__(rate, burst)
+
+# Ограничители по чатам живут между циклами, чтобы темп сохранялся в режиме демона
+chat_limiters: Dict[Tuple[str, float, int], ChatRateLimiter] = {}
+
+def get_chat_limiter(chat_id: str, rate: float = 1.0, burst: int = 3) -> ChatRateLimiter:
+    """
+    Возвращает ограничитель частоты для чата, создавая его при первом обращении.
+    """
+    key = (str(chat_id), rate, burst)
+    if key not in chat_limiters:
+        chat_limiters[key] = ChatRateLimiter(rate, burst)
+    return chat_limiters[key]
+
+def pack_messages(messages: List[str], max_length: int = TELEGRAM_MAX_LENGTH) -> Tuple[str, List[str]]:
+    """
+    Собирает сводное сообщение из уже экранированных сигналов, пока оно помещается в max_length.
+
+    :param messages: Экранированные тексты сигналов в порядке отправки.
+    :param max_length: Максимальная длина сводного сообщения.
+    :return: Сводное сообщение и сигналы, не поместившиеся в него.
+    """
+    # Обрезка не должна оставлять незавершённое экранирование
+    text = messages[0][:max_length].rstrip('\\')
+    count = 1
+    for message in messages[1:]:
+        if len(text) + len(DIGEST_SEPARATOR) + len(message) > max_length:
+            break
+        text += DIGEST_SEPARATOR + message
+        count += 1
+    return text, messages[count:]
+
+async def send_telegram_message(bot: Bot, chat_id: str, message: str, logger: logging.Logger, max_attempts: int = 5,
+                                initial_delay: float = 1.0, backoff_factor: float = 2.0,
+                                rate_limiter: Optional[ChatRateLimiter] = None, escaped: bool = False) -> bool:
     """
     Отправляет сообщение в Telegram с обработкой ошибок и экспоненциальным откатом.
 
@@ -15,74 +71,139 @@ async def send_telegram_message(bot: Bot, chat_id: str, message: str, logger: lo
     :param max_attempts: Максимальное количество попыток отправки.
     :param initial_delay: Начальная задержка перед первой повторной попыткой.
     :param backoff_factor: Фактор увеличения задержки при каждой повторной попытке.
+    :param rate_limiter: Ограничитель частоты отправки в чат.
+    :param escaped: Текст уже экранирован для MarkdownV2.
+    :return: True, если сообщение отправлено.
     """
-    escaped_message = escape_markdown(message)
+    escaped_message = message if escaped else escape_markdown(message)
     attempt = 1
     delay = initial_delay
 
     while attempt <= max_attempts:
         try:
-            await bot.send_message(chat_id=chat_id, text=escaped_message, parse_mode='MarkdownV2', disable_web_page_preview=True)
-            logger.info(f"Сообщение отправлено в Telegram: {message}")
-            return
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            with metrics.timer('telegram_send'):
+                await bot.send_message(chat_id=chat_id, text=escaped_message, parse_mode='MarkdownV2', disable_web_page_preview=True)
+            metrics.inc('messages_sent')
+            logger.info("Сообщение отправлено в Telegram (%d символов).", len(message))
+            logger.debug("Текст сообщения: %s", message)
+            return True
         except RetryAfter as e:
             wait_time = e.retry_after
-            logger.warning(f"Flood control. Повторная попытка через {wait_time} секунд. Попытка {attempt}/{max_attempts}")
-            await asyncio.sleep(wait_time)
+            if not isinstance(wait_time, (int, float)):
+                wait_time = wait_time.total_seconds()
+            metrics.inc('flood_waits')
+            logger.warning("Flood control. Повторная попытка через %s секунд. Попытка %d/%d", wait_time, attempt, max_attempts)
+            if rate_limiter is not None:
+                rate_limiter.block(wait_time)
+            else:
+                await asyncio.sleep(wait_time)
         except TimedOut:
-            logger.warning(f"Тайм-аут. Повторная попытка отправки. Попытка {attempt}/{max_attempts}")
+            logger.warning("Тайм-аут. Повторная попытка отправки. Попытка %d/%d", attempt, max_attempts)
             await asyncio.sleep(delay)
             delay *= backoff_factor
         except TelegramError as e:
-            logger.error(f"Ошибка при отправке сообщения в Telegram: {e}. Попытка {attempt}/{max_attempts}")
+            logger.error("Ошибка при отправке сообщения в Telegram: %s. Попытка %d/%d", e, attempt, max_attempts)
             await asyncio.sleep(delay)
             delay *= backoff_factor
         except Exception as e:
-            logger.error(f"Неизвестная ошибка при отправке сообщения в Telegram: {e}. Попытка {attempt}/{max_attempts}")
+            logger.error("Неизвестная ошибка при отправке сообщения в Telegram: %s. Попытка %d/%d", e, attempt, max_attempts)
             await asyncio.sleep(delay)
             delay *= backoff_factor
 
         attempt += 1
 
-    logger.error(f"Не удалось отправить сообщение после {max_attempts} попыток: {message}")
+    metrics.inc('send_failures')
+    logger.error("Не удалось отправить сообщение после %d попыток: %s", max_attempts, message)
+    return False
 
 
-async def message_worker(bot: Bot, chat_id: str, message_queue: asyncio.Queue, logger: logging.Logger, semaphore: asyncio.Semaphore):
+async def digest_worker(bot: Bot, chat_id: str, message_queue: asyncio.Queue, logger: logging.Logger,
+                        rate_limiter: ChatRateLimiter, linger: float = 0.5, max_length: int = TELEGRAM_MAX_LENGTH):
     """
-    Обработчик очереди сообщений для отправки в Telegram.
+    Отправляет сигналы из очереди сводными сообщениями.
+
+    Элемент очереди — текст сигнала или пара (текст, ключи сигналов); ключи сводки
+    попадают в результат, только если Telegram принял сообщение.
+
+    Пока ожидается разрешение ограничителя частоты, в очереди накапливаются новые сигналы:
+    каждое сообщение забирает всё, что поместится в max_length, поэтому при плотном потоке
+    сигналов запросов к Telegram становится меньше, а при редком задержка не превышает linger.
 
     :param bot: Экземпляр бота Telegram.
     :param chat_id: ID чата для отправки сообщений.
-    :param message_queue: Очередь сообщений.
+    :param message_queue: Очередь сигналов; "EXIT" завершает работу после отправки накопленного.
     :param logger: Логгер для записи логов.
-    :param semaphore: Семафор для ограничения одновременных отправок.
+    :param rate_limiter: Ограничитель частоты отправки в чат.
+    :param linger: Время ожидания попутных сигналов после первого, сек.
+    :param max_length: Максимальная длина сводного сообщения.
+    :return: Ключи сигналов из доставленных сообщений.
     """
+    pending = []  # (экранированный текст, ключи сигналов)
+    delivered = []
+    exiting = False
+    waiting_since = 0.0
+
+    def add(item):
+        message, keys = item if isinstance(item, tuple) else (item, ())
+        pending.append((escape_markdown(message), keys))
+
+    def drain():
+        nonlocal exiting
+        while not message_queue.empty():
+            message = message_queue.get_nowait()
+            message_queue.task_done()
+            if message == "EXIT":
+                exiting = True
+            else:
+                add(message)
+
     while True:
-        message = await message_queue.get()
-        if message == "EXIT":
-            logger.info("Получен сигнал завершения отправки сообщений.")
+        if not pending:
+            if exiting:
+                break
+            message = await message_queue.get()
             message_queue.task_done()
-            break
+            if message == "EXIT":
+                break
+            add(message)
+            waiting_since = time.perf_counter()
+            if linger > 0 and not exiting:
+                await asyncio.sleep(linger)
 
-        async with semaphore:
-            await send_telegram_message(bot, chat_id, message, logger)
+        # Ждём возможности отправки до сборки сообщения: за это время в очередь попадут новые сигналы
+        await rate_limiter.acquire(consume=False)
+        drain()
+        text, rest = pack_messages([message for message, _ in pending], max_length)
+        packed = pending[:len(pending) - len(rest)]
+        del pending[:len(packed)]
+        # Ожидание старейшего сигнала сводки в очереди отправки
+        metrics.observe('queue_wait', time.perf_counter() - waiting_since)
+        waiting_since = time.perf_counter()
+        if await send_telegram_message(bot, chat_id, text, logger, rate_limiter=rate_limiter, escaped=True):
+            delivered.extend(key for _, keys in packed for key in keys)
 
-        message_queue.task_done()
+    logger.info("Получен сигнал завершения отправки сообщений.")
+    return delivered
 
 
-async def run_message_workers(bot: Bot, chat_id: str, message_queue: asyncio.Queue, logger: logging.Logger, max_workers: int = 5):
+async def run_message_workers(bot: Bot, chat_id: str, message_queue: asyncio.Queue, logger: logging.Logger,
+                              rate: float = 1.0, burst: int = 3, linger: float = 0.5):
     """
-    Запускает несколько задач-воркеров для обработки очереди сообщений.
+    Запускает отправку сигналов из очереди сводными сообщениями в темпе, допустимом для чата.
+
+    Все отправки в один чат проходят через один воркер: параллельные запросы
+    в один чат только приводят к flood control.
 
     :param bot: Экземпляр бота Telegram.
     :param chat_id: ID чата для отправки сообщений.
     :param message_queue: Очередь сообщений.
     :param logger: Логгер для записи логов.
-    :param max_workers: Количество воркеров.
+    :param rate: Скорость отправки в чат, сообщений в секунду.
+    :param burst: Количество сообщений, отправляемых без ожидания.
+    :param linger: Время ожидания попутных сигналов, сек.
+    :return: Ключи сигналов из доставленных сообщений.
     """
-    semaphore = asyncio.Semaphore(max_workers)
-    workers = [
-        asyncio.create_task(message_worker(bot, chat_id, message_queue, logger, semaphore))
-        for _ in range(max_workers)
-    ]
-    await asyncio.gather(*workers)
+    rate_limiter = get_chat_limiter(chat_id, rate, burst)
+    return await digest_worker(bot, chat_id, message_queue, logger, rate_limiter, linger)
@@ -0,0 +1,162 @@
+# metrics.py
+import math
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from aiohttp import web
+
+METRICS_PREFIX = 'signal_bot'
+QUANTILES = (0.5, 0.9, 0.99)
+
+def percentile(values: List[float], quantile: float) -> float:
+    """
+    Перцентиль отсортированного списка (ближайший ранг).
+    """
+    if not values:
+        return float('nan')
+    return values[max(0, math.ceil(quantile * len(values)) - 1)]
+
+class Metrics:
+    """
+    Замеры этапов цикла сканирования и счётчики событий.
+
+    Длительности этапов хранятся за текущий цикл (для перцентилей) и накопительно
+    (сумма и количество), счётчики — накопительно и за текущий цикл.
+    """
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.stage_sum: Dict[str, float] = defaultdict(float)
+        self.stage_count: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.cycle_counters: Dict[str, int] = defaultdict(int)
+        self.last_cycle: Optional[dict] = None
+        self.last_quantiles: Dict[str, Dict[float, float]] = {}
+        self.last_samples: Dict[str, List[float]] = {}
+        self.cycles = 0
+
+    def observe(self, stage: str, seconds: float):
+        """
+        Записывает длительность этапа, сек.
+        """
+        self.samples[stage].append(seconds)
+        self.stage_sum[stage] += seconds
+        self.stage_count[stage] += 1
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Замеряет длительность блока как этап `stage`.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def inc(self, name: str, value: int = 1):
+        """
+        Увеличивает счётчик события.
+        """
+        self.counters[name] += value
+        self.cycle_counters[name] += value
+
+    def snapshot(self) -> dict:
+        """
+        Забирает замеры и счётчики текущего цикла (для передачи из процесса-воркера).
+        """
+        data = {'samples': dict(self.samples), 'counters': dict(self.cycle_counters)}
+        self.samples.clear()
+        self.cycle_counters.clear()
+        return data
+
+    def merge(self, data: dict):
+        """
+        Добавляет замеры и счётчики, полученные из snapshot другого процесса.
+        """
+        for stage, values in data['samples'].items():
+            for seconds in values:
+                self.observe(stage, seconds)
+        for name, value in data['counters'].items():
+            self.inc(name, value)
+
+    def finish_cycle(self) -> dict:
+        """
+        Завершает цикл: возвращает сводку по этапам и счётчикам цикла и начинает новый.
+        """
+        stages = {}
+        self.last_quantiles = {}
+        for stage, values in self.samples.items():
+            values = sorted(values)
+            self.last_quantiles[stage] = {quantile: percentile(values, quantile) for quantile in QUANTILES}
+            stages[stage] = {
+                'count': len(values),
+                'total_s': round(sum(values), 6),
+                'p50_ms': round(percentile(values, 0.5) * 1000, 3),
+                'p90_ms': round(percentile(values, 0.9) * 1000, 3),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+                'max_ms': round(values[-1] * 1000, 3),
+            }
+        self.cycles += 1
+        self.last_cycle = {
+            'finished_at': int(time.time()),
+            'stages': stages,
+            'counters': dict(self.cycle_counters),
+        }
+        self.last_samples = dict(self.samples)
+        self.samples.clear()
+        self.cycle_counters.clear()
+        return self.last_cycle
+
+    def render_prometheus(self) -> str:
+        """
+        Возвращает метрики в текстовом формате Prometheus.
+        Перцентили этапов — за последний завершённый цикл.
+        """
+        lines = [
+            f"# TYPE {METRICS_PREFIX}_cycles_total counter",
+            f"{METRICS_PREFIX}_cycles_total {self.cycles}",
+        ]
+        for name in sorted(self.counters):
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name}_total counter")
+            lines.append(f"{METRICS_PREFIX}_{name}_total {self.counters[name]}")
+
+        metric = f"{METRICS_PREFIX}_stage_seconds"
+        lines.append(f"# TYPE {metric} summary")
+        for stage in sorted(self.stage_count):
+            for quantile, value in self.last_quantiles.get(stage, {}).items():
+                lines.append(f'{metric}{{stage="{stage}",quantile="{quantile}"}} {value}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {self.stage_sum[stage]}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {self.stage_count[stage]}')
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> dict:
+        return {
+            'cycles': self.cycles,
+            'counters': dict(self.counters),
+            'last_cycle': self.last_cycle,
+        }
+
+# Общий сборщик метрик процесса
+metrics = Metrics()
+
+async def start_metrics_server(host: str = '127.0.0.1', port: int = 9108) -> web.AppRunner:
+    """
+    Запускает HTTP-сервер метрик: /metrics (Prometheus) и /metrics.json.
+
+    :return: Runner сервера; остановка — await runner.cleanup().
+    """
+    async def prometheus(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render_prometheus(), content_type='text/plain', charset='utf-8')
+
+    async def summary(request: web.Request) -> web.Response:
+        return web.json_response(metrics.to_json())
+
+    app = web.Application()
+    app.router.add_get('/metrics', prometheus)
+    app.router.add_get('/metrics.json', summary)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
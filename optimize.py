@@ -0,0 +1,97 @@
+# optimize.py
+import argparse
+import itertools
+import math
+import random
+from typing import Dict, List, Sequence
+from dotenv import load_dotenv
+from backtest import DEFAULT_HORIZONS, default_params, format_table, load_candles, run_backtest, write_csv
+
+# Перебираемые параметры: имя аргумента командной строки -> ключ набора параметров
+SWEEP_PARAMS = {
+    'k': 'k_period',
+    'd': 'd_period',
+    'fast': 'fast_period',
+    'slow': 'slow_period',
+    'signal': 'signal_period',
+}
+
+def parse_values(text: str) -> List[int]:
+    """
+    Разбирает список значений: "9,14,21" или диапазон "5:30:5" (начало:конец:шаг, включительно).
+    """
+    values = []
+    for part in text.split(','):
+        if ':' in part:
+            start, stop, *step = (int(value) for value in part.split(':'))
+            values.extend(range(start, stop + 1, step[0] if step else 1))
+        else:
+            values.append(int(part))
+    return sorted(set(values))
+
+def build_param_sets(grid: Dict[str, Sequence[int]], samples: int = None, seed: int = 0) -> List[dict]:
+    """
+    Строит наборы параметров: полный перебор сетки или случайная выборка из неё.
+    Комбинации с fast_period >= slow_period отбрасываются.
+
+    :param grid: Значения по каждому ключу набора параметров.
+    :param samples: Количество случайных комбинаций (None — полная сетка).
+    """
+    keys = list(grid)
+    combinations = [
+        dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))
+    ]
+    combinations = [
+        combination for combination in combinations
+        if combination.get('fast_period', 0) < combination.get('slow_period', math.inf)
+    ]
+    if samples is not None and samples < len(combinations):
+        combinations = random.Random(seed).sample(combinations, samples)
+
+    base = default_params()
+    # Сортировка по периодам, чтобы соседние наборы чаще переиспользовали кэш
+    return sorted((dict(base, **combination) for combination in combinations),
+                  key=lambda params: tuple(params[key] for key in keys))
+
+def rank(rows: List[dict], rank_by: str, min_signals: int = 1) -> List[dict]:
+    """
+    Сортирует результаты по метрике (по убыванию), отбрасывая наборы с малым числом сигналов.
+    """
+    rows = [row for row in rows if row['signals'] >= min_signals and not math.isnan(row[rank_by])]
+    return sorted(rows, key=lambda row: row[rank_by], reverse=True)
+
+def main():
+    load_dotenv()
+    defaults = default_params()
+    parser = argparse.ArgumentParser(description="Перебор периодов Стохастика и MACD на сохранённых свечах.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--csv-dir', help="Каталог CSV-файлов SYMBOL.csv")
+    source.add_argument('--store', help="Файл хранилища свечей (SQLite)")
+    parser.add_argument('--interval', default='15', help="Интервал свечей в хранилище")
+    parser.add_argument('--limit', type=int, default=35_040, help="Максимум свечей на символ из хранилища")
+    for name, key in SWEEP_PARAMS.items():
+        parser.add_argument(f'--{name}', default=str(defaults[key]), help=f"Значения {key}: список или диапазон начало:конец:шаг")
+    parser.add_argument('--random', type=int, default=None, help="Количество случайных комбинаций вместо полной сетки")
+    parser.add_argument('--seed', type=int, default=0, help="Зерно случайной выборки")
+    parser.add_argument('--horizons', default=",".join(map(str, DEFAULT_HORIZONS)), help="Горизонты доходности в свечах")
+    parser.add_argument('--rank-by', default=None, help="Метрика ранжирования (по умолчанию mean_ret второго горизонта)")
+    parser.add_argument('--min-signals', type=int, default=30, help="Минимум сигналов для попадания в рейтинг")
+    parser.add_argument('--top', type=int, default=20, help="Сколько лучших наборов вывести")
+    parser.add_argument('--workers', type=int, default=None, help="Количество процессов")
+    parser.add_argument('--output', help="Сохранить полный рейтинг в CSV")
+    args = parser.parse_args()
+
+    horizons = [int(horizon) for horizon in args.horizons.split(',')]
+    rank_by = args.rank_by or f"mean_ret_{horizons[min(1, len(horizons) - 1)]}"
+    grid = {key: parse_values(getattr(args, name)) for name, key in SWEEP_PARAMS.items()}
+    param_sets = build_param_sets(grid, args.random, args.seed)
+    print(f"Наборов параметров: {len(param_sets)}")
+
+    rows = rank(run_backtest(load_candles(args), param_sets, horizons, workers=args.workers), rank_by, args.min_signals)
+    columns = list(SWEEP_PARAMS.values()) + ['signals', 'long', 'short'] + [column for column in (rows[0] if rows else {}) if column.startswith(('mean_ret', 'hit_rate'))]
+    print(format_table([{column: row[column] for column in columns} for row in rows[:args.top]]))
+    if args.output and rows:
+        write_csv(rows, args.output)
+
+if __name__ == "__main__":
+    main()
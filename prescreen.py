@@ -0,0 +1,118 @@
+# prescreen.py
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from candles import Candles
+from config import Settings
+from stochastic_oscillator import calculate_stochastic_oscillator
+from macd import calculate_macd
+
+# Оценка по тикеру имеет смысл только вскоре после закрытия свечи, пока lastPrice близка к её закрытию
+MAX_CLOSE_LAG_MS = 60_000
+
+# Диапазон индикаторов только что закрытой свечи: %K, %D (минимум и максимум) и максимум MACD
+IndicatorRange = Tuple[float, float, float, float, float]
+
+def estimate_range(history: Candles, ticker: Dict[str, float], start: int, settings: Settings,
+                   tolerance: float) -> Optional[IndicatorRange]:
+    """
+    Оценивает границы индикаторов только что закрытой свечи по сохранённым закрытым
+    свечам до неё и тикеру.
+
+    Закрытие свечи принимается равным lastPrice с допуском tolerance, максимум свечи —
+    не выше highPrice24h, минимум — не ниже lowPrice24h. %K убывает при росте максимума
+    окна и при снижении закрытия, MACD растёт вместе с закрытием, поэтому границы
+    достигаются на двух крайних вариантах свечи.
+
+    :param history: Закрытые свечи непосредственно до оцениваемой (от старых к новым).
+    :param ticker: Тикер символа из get_tickers.
+    :param start: Время открытия оцениваемой свечи, мс.
+    :param tolerance: Допустимое отклонение закрытия от lastPrice (доля).
+    :return: (%K min, %D min, %K max, %D max, MACD max) или None, если данных недостаточно.
+    """
+    needed = settings.kline_limit - 2
+    if len(history) < needed:
+        return None
+    history = history[-needed:]
+
+    open_price = history.close[-1]
+    last_price = ticker['lastPrice']
+    low_close = last_price * (1 - tolerance)
+    high_close = last_price * (1 + tolerance)
+
+    # Свеча с наименьшим возможным %K: максимум окна как можно выше, минимум — как можно выше
+    low_case = history[:]
+    low_case.append((start, open_price, max(ticker['highPrice24h'], open_price, low_close),
+                     min(open_price, low_close), low_close, 0))
+    # Свеча с наибольшим возможным %K и MACD: закрытие выше, минимум — как можно ниже
+    high_case = history[:]
+    high_case.append((start, open_price, max(open_price, high_close),
+                      min(ticker['lowPrice24h'], open_price, high_close), high_close, 0))
+
+    k_min, d_min = calculate_stochastic_oscillator(low_case, settings.k_period, settings.d_period)
+    k_max, d_max = calculate_stochastic_oscillator(high_case, settings.k_period, settings.d_period)
+    macd_max, _, _ = calculate_macd(high_case, settings.fast_period, settings.slow_period, settings.signal_period)
+    if None in (k_min, d_min, k_max, d_max, macd_max):
+        return None
+    return k_min, d_min, k_max, d_max, macd_max
+
+def passes_filters(bounds: IndicatorRange, settings: Settings) -> bool:
+    """
+    Проверяет, может ли интервал пройти фильтры process_symbol (%K и MACD).
+    """
+    k_min, _, _, _, macd_max = bounds
+    return k_min <= settings.max_percent_k and macd_max >= settings.min_macd
+
+def may_signal(bounds: IndicatorRange, settings: Settings) -> bool:
+    """
+    Проверяет, могут ли %K и %D оказаться в зоне перепроданности или перекупленности.
+    """
+    k_min, d_min, k_max, d_max, _ = bounds
+    return ((k_min < settings.oversold and d_min < settings.oversold) or
+            (k_max > settings.overbought and d_max > settings.overbought))
+
+def prescreen_symbols(symbols: Iterable[str], tickers: Dict[str, Dict[str, float]], intervals: Iterable[str],
+                      settings: Settings, load_history: Optional[Callable[[str, str], Tuple[Candles, int]]] = None) -> List[str]:
+    """
+    Отбирает символы, которые могут дать сигнал в этом цикле.
+
+    Символ исключается, если его оборот за 24 часа ниже MIN_TURNOVER_24H или если по
+    сохранённым свечам и тикеру видно, что хотя бы один интервал точно не пройдёт фильтры
+    process_symbol (символ тогда отбрасывается целиком), либо ни один интервал не может
+    дать сигнал. Символы без тикера или без истории свечей остаются в списке.
+
+    :param tickers: Тикеры из get_tickers.
+    :param intervals: Интервалы цикла.
+    :param load_history: Функция (символ, интервал) -> (закрытые свечи до оцениваемой,
+                         время открытия оцениваемой свечи) или None, если истории нет.
+    :return: Символы для полной проверки (в исходном порядке).
+    """
+    intervals = list(intervals)
+    if settings.signal_gate or settings.signal_rules:
+        # Границы индикаторов проверяются только для правил по умолчанию (пороги настроек)
+        load_history = None
+    shortlist = []
+    for symbol in symbols:
+        ticker = tickers.get(symbol)
+        if ticker is None:
+            shortlist.append(symbol)
+            continue
+        if ticker['turnover24h'] < settings.min_turnover_24h:
+            continue
+        if load_history is None:
+            shortlist.append(symbol)
+            continue
+
+        keep = False
+        for interval in intervals:
+            loaded = load_history(symbol, interval)
+            bounds = estimate_range(loaded[0], ticker, loaded[1], settings, settings.prescreen_tolerance) if loaded else None
+            if bounds is None:
+                # Без оценки интервал может дать сигнал
+                keep = True
+                continue
+            if not passes_filters(bounds, settings):
+                keep = False
+                break
+            keep = keep or may_signal(bounds, settings)
+        if keep:
+            shortlist.append(symbol)
+    return shortlist
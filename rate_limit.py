@@ -0,0 +1,62 @@
+# rate_limit.py
+import asyncio
+import time
+
+class TokenBucket:
+    """
+    Ограничитель частоты (token bucket) с приостановкой на заданное время.
+
+    Общая основа ограничителей запросов к Bybit и сообщений в Telegram.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        :param rate: Скорость пополнения, токенов в секунду.
+        :param burst: Ёмкость корзины.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = None
+        self._lock_loop = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        # Блокировка привязана к циклу событий, а ограничитель переживает его: процессы
+        # сканирования и повторные вызовы asyncio.run запускают новый цикл, для него создаётся своя
+        loop = asyncio.get_running_loop()
+        if self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, consume: bool = True):
+        """
+        Ожидает, пока в корзине появится токен.
+
+        :param consume: Забрать токен; False — только дождаться, когда он станет доступен.
+        """
+        async with self._get_lock():
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    if consume:
+                        self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds: float):
+        """
+        Приостанавливает выдачу токенов на заданное время.
+        """
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
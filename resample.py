@@ -0,0 +1,51 @@
+# resample.py
+from candles import Candles
+
+def resample_candles(candles: Candles, base_ms: int, target_ms: int) -> Candles:
+    """
+    Собирает свечи старшего интервала из свечей базового интервала.
+
+    Границы свечей выравниваются по UTC (как у Bybit: 4h — 00:00, 04:00, ...; 1d — 00:00).
+    В результат попадают только закрытые свечи: в корзине должны быть первая и последняя
+    базовые свечи периода. Open — первой свечи, high — максимум, low — минимум,
+    close — последней свечи, volume — сумма.
+
+    :param candles: Закрытые свечи базового интервала (от старых к новым).
+    :param base_ms: Длительность базового интервала, мс.
+    :param target_ms: Длительность целевого интервала, мс (кратна базовому).
+    :return: Свечи целевого интервала.
+    """
+    if target_ms % base_ms != 0:
+        raise ValueError(f"Интервал {target_ms} мс не кратен базовому {base_ms} мс")
+
+    result = Candles()
+    last_offset = target_ms - base_ms
+    bucket_start = None
+    first_start = 0
+    last_start = 0
+    open_price = high = low = close = volume = 0.0
+
+    for i in range(len(candles)):
+        start = candles.start[i]
+        bucket = start - start % target_ms
+        if bucket != bucket_start:
+            if bucket_start is not None and first_start == bucket_start and last_start - bucket_start == last_offset:
+                result.append((bucket_start, open_price, high, low, close, volume))
+            bucket_start = bucket
+            first_start = start
+            open_price = candles.open[i]
+            high = candles.high[i]
+            low = candles.low[i]
+            volume = 0.0
+        else:
+            if candles.high[i] > high:
+                high = candles.high[i]
+            if candles.low[i] < low:
+                low = candles.low[i]
+        close = candles.close[i]
+        volume += candles.volume[i]
+        last_start = start
+
+    if bucket_start is not None and first_start == bucket_start and last_start - bucket_start == last_offset:
+        result.append((bucket_start, open_price, high, low, close, volume))
+    return result
@@ -0,0 +1,291 @@
+# rules.py
+import operator
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple, Union
+import numpy as np
+from candles import Candles
+from config import Settings
+from stochastic_oscillator import calculate_stochastic_oscillator
+from macd import calculate_macd
+from batch_indicators import calculate_stochastic_oscillator_batch, calculate_macd_batch
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+# Группы индикаторов, рассчитываемых вместе, и их относительная стоимость
+INDICATOR_GROUPS = {
+    'stochastic': ('%K', '%D'),
+    'macd': ('MACD', 'Signal', 'Histogram'),
+}
+GROUP_COST = {
+    'stochastic': 1,  # Минимумы и максимумы по окну k_period + d_period - 1
+    'macd': 3,  # Три EMA по всему окну свечей
+}
+INDICATOR_GROUP = {name: group for group, names in INDICATOR_GROUPS.items() for name in names}
+
+# Названия правил: от них зависят направление сделки в сообщении и оценка силы сигнала
+RULE_NAMES = ('long', 'short')
+
+_CONDITION_RE = re.compile(r'^\s*(\S+)\s*(<=|>=|<|>)\s*(\S+)\s*$')
+
+@dataclass(frozen=True)
+class Condition:
+    """
+    Сравнение индикатора с числом или другим индикатором: %K < 20, MACD > Signal.
+    """
+    indicator: str
+    op: str
+    value: Union[float, str]
+
+    @property
+    def groups(self) -> Tuple[str, ...]:
+        names = (self.indicator, self.value) if isinstance(self.value, str) else (self.indicator,)
+        return tuple(dict.fromkeys(INDICATOR_GROUP[name] for name in names))
+
+    @property
+    def cost(self) -> int:
+        return sum(GROUP_COST[group] for group in self.groups)
+
+    def __str__(self) -> str:
+        return f"{self.indicator} {self.op} {self.value}"
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    Сигнал name, если выполняются все условия.
+    """
+    name: str
+    conditions: Tuple[Condition, ...]
+
+def parse_condition(text: str) -> Condition:
+    """
+    Разбирает условие вида «%K < 20» или «MACD > Signal».
+
+    :raises ValueError: Если условие записано неверно или индикатор неизвестен.
+    """
+    match = _CONDITION_RE.match(text)
+    if not match:
+        raise ValueError(f"некорректное условие {text.strip()!r}")
+    indicator, op, value = match.groups()
+    if indicator not in INDICATOR_GROUP:
+        raise ValueError(f"неизвестный индикатор {indicator!r}")
+    if value not in INDICATOR_GROUP:
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValueError(f"неизвестный индикатор {value!r}") from None
+    return Condition(indicator, op, value)
+
+def parse_conditions(text: str) -> Tuple[Condition, ...]:
+    """
+    Разбирает условия, объединённые через «&».
+    """
+    return tuple(parse_condition(part) for part in text.split('&') if part.strip())
+
+def parse_rules(text: str) -> Tuple[Rule, ...]:
+    """
+    Разбирает правила вида «long: %K < 20 & %D < 20; short: %K > 80 & %D > 80».
+    Правила проверяются по порядку, срабатывает первое подходящее.
+
+    :raises ValueError: Если правило записано неверно.
+    """
+    rules = []
+    for part in text.split(';'):
+        if not part.strip():
+            continue
+        name, separator, conditions = part.partition(':')
+        name = name.strip().lower()
+        if not separator or name not in RULE_NAMES:
+            raise ValueError(f"правило {part.strip()!r} должно начинаться с {' или '.join(RULE_NAMES)}:")
+        rules.append(Rule(name, parse_conditions(conditions)))
+    return tuple(rules)
+
+def default_gate(settings: Settings) -> str:
+    """
+    Фильтр символа по умолчанию: MAX_PERCENT_K и MIN_MACD.
+    """
+    return f"%K <= {settings.max_percent_k} & MACD >= {settings.min_macd}"
+
+def default_rules(settings: Settings) -> str:
+    """
+    Правила сигналов по умолчанию: зоны перепроданности и перекупленности %K и %D.
+    """
+    return (f"long: %K < {settings.oversold} & %D < {settings.oversold}; "
+            f"short: %K > {settings.overbought} & %D > {settings.overbought}")
+
+class IndicatorContext:
+    """
+    Индикаторы свечей, рассчитываемые при первом обращении (группой) и запоминаемые.
+    Поддерживает get() как словарь результата analyze_candles.
+    """
+
+    def __init__(self, candles: Candles, settings: Settings, values: Optional[Dict[str, float]] = None):
+        """
+        :param values: Уже известные значения индикаторов последней свечи (например, потоковые).
+        """
+        self.candles = candles
+        self.settings = settings
+        self.values: Dict[str, Optional[float]] = dict(values or {})
+        self.signal: Optional[str] = None
+
+    def _compute(self, group: str):
+        settings = self.settings
+        if group == 'stochastic':
+            values = calculate_stochastic_oscillator(self.candles, settings.k_period, settings.d_period)
+        else:
+            values = calculate_macd(self.candles, settings.fast_period, settings.slow_period, settings.signal_period)
+        self.values.update(zip(INDICATOR_GROUPS[group], values))
+
+    def __getitem__(self, name: str) -> Optional[float]:
+        if name == 'signal':
+            return self.signal
+        if name not in self.values:
+            self._compute(INDICATOR_GROUP[name])
+        return self.values[name]
+
+    def get(self, name: str, default=None):
+        value = self[name]
+        return default if value is None else value
+
+@dataclass(frozen=True)
+class RulePlan:
+    """
+    Скомпилированные фильтр и правила: условия упорядочены от дешёвых к дорогим,
+    проверка прекращается на первом невыполненном условии.
+    """
+    gate: Tuple[Condition, ...]
+    rules: Tuple[Rule, ...]
+
+    @staticmethod
+    def _check(context, condition: Condition) -> Optional[bool]:
+        left = context[condition.indicator]
+        right = context[condition.value] if isinstance(condition.value, str) else condition.value
+        if left is None or right is None:
+            return None
+        return OPERATORS[condition.op](left, right)
+
+    def evaluate(self, candles: Candles, settings: Settings,
+                 values: Optional[Dict[str, float]] = None) -> Tuple[Optional[bool], IndicatorContext]:
+        """
+        Проверяет фильтр и правила на свечах одного символа.
+
+        :param values: Уже известные значения индикаторов последней свечи; они не пересчитываются.
+
+        :return: (результат фильтра: True, False или None при нехватке данных; индикаторы
+                 с найденным сигналом в поле signal). Индикаторы рассчитываются только
+                 по мере необходимости.
+        """
+        context = IndicatorContext(candles, settings, values)
+        for condition in self.gate:
+            passed = self._check(context, condition)
+            if not passed:
+                return passed, context
+        for rule in self.rules:
+            if all(self._check(context, condition) for condition in rule.conditions):
+                context.signal = rule.name
+                break
+        return True, context
+
+    def evaluate_batch(self, highs: np.ndarray, lows: np.ndarray, closes: np.ndarray,
+                       settings: Settings) -> Dict[str, np.ndarray]:
+        """
+        Пакетная проверка фильтра и правил по всем символам.
+
+        Группа индикаторов рассчитывается только для символов, дошедших до условия,
+        которому она нужна; для остальных значения — NaN.
+
+        :param highs: Максимумы формы (символы, свечи), свечи от старых к новым.
+        :param lows: Минимумы формы (символы, свечи).
+        :param closes: Цены закрытия формы (символы, свечи).
+        :return: Массивы индикаторов, маска прошедших фильтр 'passed'
+                 и массив сигналов 'signal' ('long', 'short' или None).
+        """
+        count = closes.shape[0]
+        values = {name: np.full(count, np.nan) for name in INDICATOR_GROUP}
+        computed = np.zeros((len(INDICATOR_GROUPS), count), dtype=bool)
+        group_index = {group: i for i, group in enumerate(INDICATOR_GROUPS)}
+
+        def load(name: str, rows: np.ndarray) -> np.ndarray:
+            group = INDICATOR_GROUP[name]
+            missing = rows[~computed[group_index[group], rows]]
+            if len(missing):
+                if group == 'stochastic':
+                    results = calculate_stochastic_oscillator_batch(
+                        highs[missing], lows[missing], closes[missing], settings.k_period, settings.d_period)
+                else:
+                    results = calculate_macd_batch(
+                        closes[missing], settings.fast_period, settings.slow_period, settings.signal_period)
+                for field, result in zip(INDICATOR_GROUPS[group], results):
+                    values[field][missing] = result
+                computed[group_index[group], missing] = True
+            return values[name][rows]
+
+        passed, signals = self.evaluate_arrays(count, load)
+        return dict(values, passed=passed, signal=signals)
+
+    def evaluate_arrays(self, count: int, load: Callable[[str, np.ndarray], np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Проверяет фильтр и правила по массивам индикаторов (символов или свечей).
+
+        Значения запрашиваются только для элементов, дошедших до условия.
+
+        :param count: Количество проверяемых элементов.
+        :param load: Функция (индикатор, индексы элементов) -> значения индикатора для них.
+        :return: Маска прошедших фильтр и массив сигналов ('long', 'short' или None).
+        """
+        def check(condition: Condition, rows: np.ndarray) -> np.ndarray:
+            # Сравнения с NaN дают False: при нехватке данных условие не выполняется
+            left = load(condition.indicator, rows)
+            right = load(condition.value, rows) if isinstance(condition.value, str) else condition.value
+            return OPERATORS[condition.op](left, right)
+
+        def select(conditions: Tuple[Condition, ...], rows: np.ndarray) -> np.ndarray:
+            for condition in conditions:
+                if not len(rows):
+                    break
+                rows = rows[check(condition, rows)]
+            return rows
+
+        passed_rows = select(self.gate, np.arange(count))
+        passed = np.zeros(count, dtype=bool)
+        passed[passed_rows] = True
+
+        signals = np.full(count, None, dtype=object)
+        pending = passed_rows
+        for rule in self.rules:
+            matched = select(rule.conditions, pending)
+            signals[matched] = rule.name
+            pending = np.setdiff1d(pending, matched, assume_unique=True)
+        return passed, signals
+
+def _ordered(conditions: Tuple[Condition, ...]) -> Tuple[Condition, ...]:
+    # Устойчивая сортировка: при равной стоимости сохраняется порядок объявления
+    return tuple(sorted(conditions, key=lambda condition: condition.cost))
+
+@lru_cache(maxsize=32)
+def compile_rules(gate: str, rules: str) -> RulePlan:
+    """
+    Разбирает фильтр и правила и строит план проверки.
+
+    :param gate: Условия фильтра символа через «&» (символ отбрасывается, если фильтр не пройден).
+    :param rules: Правила сигналов через «;».
+    :raises ValueError: Если фильтр или правила записаны неверно.
+    """
+    return RulePlan(
+        gate=_ordered(parse_conditions(gate)),
+        rules=tuple(Rule(rule.name, _ordered(rule.conditions)) for rule in parse_rules(rules)),
+    )
+
+def get_rule_plan(settings: Settings) -> RulePlan:
+    """
+    Возвращает план проверки для настроек: SIGNAL_GATE и SIGNAL_RULES,
+    а при их отсутствии — правила по порогам MAX_PERCENT_K, MIN_MACD, OVERSOLD и OVERBOUGHT.
+    """
+    return compile_rules(settings.signal_gate or default_gate(settings),
+                         settings.signal_rules or default_rules(settings))
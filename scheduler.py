@@ -0,0 +1,57 @@
+# scheduler.py
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+def prioritize_symbols(symbols: Iterable[str], turnover: Optional[Dict[str, float]] = None,
+                       recent: Iterable[str] = ()) -> List[str]:
+    """
+    Упорядочивает символы для сканирования: сначала символы с недавними сигналами,
+    затем по убыванию оборота за 24 часа; при равенстве сохраняется исходный порядок.
+
+    :param turnover: Оборот за 24 часа по символам.
+    :param recent: Символы, по которым недавно были сигналы.
+    """
+    turnover = turnover or {}
+    recent = set(recent)
+    return sorted(symbols, key=lambda symbol: (symbol not in recent, -turnover.get(symbol, 0.0)))
+
+async def run_bounded(items: Iterable, handler: Callable[..., Awaitable], concurrency: int,
+                      deadline: Optional[float] = None, logger: Optional[logging.Logger] = None) -> list:
+    """
+    Обрабатывает элементы по порядку не более чем concurrency воркерами.
+
+    При наступлении deadline выполняющиеся обработчики отменяются (вместе с их
+    HTTP-запросами), а необработанные элементы не запускаются. Ошибка обработчика
+    записывается в лог и не прерывает обработку остальных элементов.
+
+    :param handler: Корутина, вызываемая для каждого элемента.
+    :param deadline: Крайний срок (Unix timestamp) или None.
+    :param logger: Логгер для ошибок обработчика.
+    :return: Элементы, обработка которых не завершилась (в порядке очереди).
+    """
+    logger = logger or logging.getLogger(__name__)
+    pending = deque(items)
+    in_flight = {}
+
+    async def worker(index: int):
+        while pending:
+            item = pending.popleft()
+            in_flight[index] = item
+            try:
+                await handler(item)
+            except Exception:
+                logger.exception("Ошибка при обработке %s", item)
+            del in_flight[index]
+
+    workers = [asyncio.create_task(worker(index)) for index in range(min(concurrency, len(pending)))]
+    if not workers:
+        return []
+    timeout = None if deadline is None else max(0.0, deadline - time.time())
+    done, running = await asyncio.wait(workers, timeout=timeout)
+    for task in running:
+        task.cancel()
+    await asyncio.gather(*running, return_exceptions=True)
+    return list(in_flight.values()) + list(pending)
@@ -59,66 +59,47 @@ python3 -m venv "$VENV_DIR"
 echo "📦 Установка зависимостей..."
 source "$VENV_DIR/bin/activate"
 pip install --upgrade pip
-pip install python-telegram-bot aiohttp python-dotenv
+pip install python-telegram-bot aiohttp python-dotenv numpy orjson
 deactivate
 
 # Шаг 3: Создание systemd сервиса
+# Бот работает в режиме демона: планировщик внутри процесса просыпается
+# на закрытии свечей, поэтому таймер больше не нужен.
 echo "🔧 Создание systemd сервиса в $SERVICE_FILE..."
 
 cat <<EOL > "$SERVICE_FILE"
 [Unit]
 Description=bot_rsi_macd Project Service
-After=network.target
+After=network-online.target
+Wants=network-online.target
 
 [Service]
-Type=oneshot
+Type=simple
 User=$USER
 WorkingDirectory=$PROJECT_DIR
 Environment="PATH=$VENV_DIR/bin"
+Environment="DAEMON_MODE=true"
 ExecStart=$PYTHON_EXEC $MAIN_SCRIPT
-Restart=no
+Restart=always
+RestartSec=10
 
 [Install]
 WantedBy=multi-user.target
 EOL
 
-# Шаг 4: Создание systemd таймера
-echo "🔧 Создание systemd таймера в $TIMER_FILE..."
-
-cat <<EOL > "$TIMER_FILE"
-[Unit]
-Description=Run bot_rsi_macd Project
-
-[Timer]
-OnCalendar=*:0/15
-Persistent=true
-
-[Install]
-WantedBy=timers.target
-EOL
-
 systemctl daemon-reload
 
-# Шаг 5: Запуск и включение сервиса
-echo "🚀 Первый запуск сервиса $SERVICE_NAME..."
-systemctl start "$SERVICE_NAME"
-
-# Ждем завершения
-while systemctl is-active --quiet "$SERVICE_NAME"; do
-    sleep 1
-done
-echo "✅ Первый запуск завершён."
-
-echo "🚀 Запуск и включение таймера $TIMER_NAME..."
-systemctl start "$TIMER_NAME"
-systemctl enable "$TIMER_NAME"
+# Шаг 4: Запуск и включение сервиса
+echo "🚀 Запуск и включение сервиса $SERVICE_NAME..."
+systemctl enable "$SERVICE_NAME"
+systemctl restart "$SERVICE_NAME"
 
-echo "🔍 Проверка статуса таймера..."
-systemctl status "$TIMER_NAME" --no-pager
+echo "🔍 Проверка статуса сервиса..."
+systemctl status "$SERVICE_NAME" --no-pager
 
-echo "🎉 Настройка завершена. Таймер настроен на выполнение каждые 5 минут!"
+echo "🎉 Настройка завершена. Бот работает в режиме демона и анализирует свечи при каждом закрытии!"
 
-# Шаг 6: Явный запуск main.py для первого выполнения
+# Шаг 5: Явный запуск main.py для первого выполнения
 echo "🚀 Явный запуск main.py для первого выполнения..."
 source "$VENV_DIR/bin/activate"
 MANUAL_RUN=true $PYTHON_EXEC $MAIN_SCRIPT || echo "❌ Ошибка первого запуска main.py. Проверьте логи."
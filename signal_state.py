@@ -0,0 +1,103 @@
+# signal_state.py
+import sqlite3
+from typing import Iterable, List, Tuple
+
+# Ключ сигнала: (символ, интервал, направление, время открытия свечи сигнала, мс)
+SignalKey = Tuple[str, str, str, int]
+
+class SignalState:
+    """
+    Состояние сигналов между циклами в SQLite по ключу (символ, интервал, направление).
+
+    Для каждого ключа хранятся свеча, на которой сигнал был виден последний раз, и свеча,
+    по которой он был отправлен. Сигнал, который держится свеча за свечой, считается
+    повтором, пока с отправки не прошло время cooldown; пропавший хотя бы на одну свечу
+    сигнал при появлении снова считается новым.
+    """
+
+    def __init__(self, path: str = 'signal_state.db'):
+        """
+        :param path: Путь к файлу базы данных.
+        """
+        self.path = path
+        # Несколько процессов сканирования пишут в одну базу — ждём освобождения блокировки
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS signals (
+                symbol TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                direction TEXT NOT NULL,
+                seen_start INTEGER NOT NULL,
+                sent_start INTEGER,
+                expires_at INTEGER NOT NULL,
+                PRIMARY KEY (symbol, interval, direction)
+            ) WITHOUT ROWID
+            """
+        )
+        self.conn.commit()
+
+    def observe(self, symbol: str, interval: str, direction: str, start: int,
+                interval_ms: int, cooldown_ms: int) -> bool:
+        """
+        Запоминает сигнал на свече start и проверяет, новый ли он.
+
+        :param start: Время открытия свечи сигнала, мс.
+        :param interval_ms: Длительность свечи интервала, мс.
+        :param cooldown_ms: Время, в течение которого непрерывный сигнал не отправляется повторно, мс.
+        :return: True, если сигнал новый или с его отправки прошло cooldown_ms.
+        """
+        row = self.conn.execute(
+            "SELECT seen_start, sent_start FROM signals WHERE symbol = ? AND interval = ? AND direction = ?",
+            (symbol, interval, direction),
+        ).fetchone()
+        fresh = True
+        if row is not None:
+            seen_start, sent_start = row
+            # Сигнал держится непрерывно: он был и на предыдущей (или этой же) свече
+            continuous = seen_start >= start - interval_ms
+            fresh = not (continuous and sent_start is not None and start - sent_start < cooldown_ms)
+            if not continuous:
+                sent_start = None
+        else:
+            sent_start = None
+
+        # Запись устаревает, если сигнал не повторится на следующей свече
+        self.conn.execute(
+            "INSERT OR REPLACE INTO signals VALUES (?, ?, ?, ?, ?, ?)",
+            (symbol, interval, direction, max(start, row[0]) if row else start, sent_start, start + 2 * interval_ms),
+        )
+        self.conn.commit()
+        return fresh
+
+    def mark_sent(self, keys: Iterable[SignalKey]):
+        """
+        Отмечает сигналы отправленными (после отбора сильнейших сигналов цикла).
+        """
+        self.conn.executemany(
+            "UPDATE signals SET sent_start = ? WHERE symbol = ? AND interval = ? AND direction = ?",
+            [(start, symbol, interval, direction) for symbol, interval, direction, start in keys],
+        )
+        self.conn.commit()
+
+    def active_symbols(self) -> List[str]:
+        """
+        Возвращает символы с непрерывающимися сигналами.
+        """
+        rows = self.conn.execute("SELECT DISTINCT symbol FROM signals ORDER BY symbol").fetchall()
+        return [row[0] for row in rows]
+
+    def evict(self, now_ms: int) -> int:
+        """
+        Удаляет записи сигналов, которые прервались.
+
+        :return: Количество удалённых записей.
+        """
+        cursor = self.conn.execute("DELETE FROM signals WHERE expires_at < ?", (now_ms,))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        self.conn.close()
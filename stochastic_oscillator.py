@@ -1,11 +1,12 @@
 # stochastic_oscillator.py
-from typing import List, Dict, Tuple, Optional
+from typing import Tuple, Optional
+from candles import Candles
 
-def calculate_stochastic_oscillator(candles: List[Dict[str, float]], k_period: int = 14, d_period: int = 3) -> Tuple[Optional[float], Optional[float]]:
+def calculate_stochastic_oscillator(candles: Candles, k_period: int = 14, d_period: int = 3) -> Tuple[Optional[float], Optional[float]]:
     """
     Рассчитывает Стохастический осциллятор (%K и %D).
 
-    :param candles: Список свечей (от старых к новым) в формате List[Dict].
+    :param candles: Свечи (от старых к новым).
     :param k_period: Период для расчёта %K.
     :param d_period: Период для расчёта %D.
     :return: Последние значения %K и %D.
@@ -13,11 +14,11 @@ def calculate_stochastic_oscillator(candles: List[Dict[str, float]], k_period: i
     if len(candles) < k_period + d_period - 1:
         return None, None
 
-    # Извлекаем необходимые данные из словарей
-    relevant_candles = candles[-(k_period + d_period - 1):]
-    highs = [float(candle['high']) for candle in relevant_candles]
-    lows = [float(candle['low']) for candle in relevant_candles]
-    closes = [float(candle['close']) for candle in relevant_candles]
+    # Берём только необходимые значения из колонок
+    window = k_period + d_period - 1
+    highs = candles.high[-window:]
+    lows = candles.low[-window:]
+    closes = candles.close[-window:]
 
     # Рассчитываем %K без сглаживания
     percent_k_list = []
@@ -0,0 +1,213 @@
+# streaming_indicators.py
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+class StreamingEMA:
+    """
+    EMA, обновляемая по одному значению за O(1).
+
+    Первое значение — SMA первых `period` значений, как в calculate_macd.
+    """
+    __slots__ = ('period', 'multiplier', 'value', '_seed_sum', '_seed_count')
+
+    def __init__(self, period: int):
+        self.period = period
+        self.multiplier = 2 / (period + 1)
+        self.value: Optional[float] = None
+        self._seed_sum = 0.0
+        self._seed_count = 0
+
+    def update(self, x: float) -> Optional[float]:
+        """
+        Добавляет новое значение.
+
+        :param x: Новое значение ряда.
+        :return: Текущее значение EMA или None, если данных пока недостаточно.
+        """
+        if self.value is not None:
+            self.value = (x - self.value) * self.multiplier + self.value
+        else:
+            self._seed_sum += x
+            self._seed_count += 1
+            if self._seed_count == self.period:
+                self.value = self._seed_sum / self.period
+        return self.value
+
+class StreamingStochastic:
+    """
+    Стохастический осциллятор (%K и %D), обновляемый по одной закрытой свече.
+
+    Скользящие максимум и минимум хранятся в монотонных очередях, поэтому
+    обновление выполняется за амортизированное O(1).
+    """
+    __slots__ = ('k_period', 'd_period', '_index', '_highs', '_lows', '_k_values', 'percent_k', 'percent_d')
+
+    def __init__(self, k_period: int = 14, d_period: int = 3):
+        self.k_period = k_period
+        self.d_period = d_period
+        self._index = 0
+        self._highs = deque()  # (индекс, high) по убыванию high
+        self._lows = deque()  # (индекс, low) по возрастанию low
+        self._k_values = deque(maxlen=d_period)
+        self.percent_k: Optional[float] = None
+        self.percent_d: Optional[float] = None
+
+    def update(self, high: float, low: float, close: float) -> Tuple[Optional[float], Optional[float]]:
+        """
+        Добавляет закрытую свечу.
+
+        :return: Текущие значения %K и %D (None, если данных пока недостаточно).
+        """
+        index = self._index
+        self._index += 1
+
+        while self._highs and self._highs[-1][1] <= high:
+            self._highs.pop()
+        self._highs.append((index, high))
+        while self._lows and self._lows[-1][1] >= low:
+            self._lows.pop()
+        self._lows.append((index, low))
+
+        # Удаляем значения, вышедшие из окна k_period
+        window_start = index - self.k_period + 1
+        if self._highs[0][0] < window_start:
+            self._highs.popleft()
+        if self._lows[0][0] < window_start:
+            self._lows.popleft()
+
+        if window_start < 0:
+            return None, None
+
+        highest_high = self._highs[0][1]
+        lowest_low = self._lows[0][1]
+        if highest_high == lowest_low:
+            self.percent_k = 0
+        else:
+            self.percent_k = ((close - lowest_low) / (highest_high - lowest_low)) * 100
+
+        self._k_values.append(self.percent_k)
+        if len(self._k_values) == self.d_period:
+            self.percent_d = sum(self._k_values) / self.d_period
+
+        if self.percent_d is None:
+            # %D ещё не сформирован — как в calculate_stochastic_oscillator
+            return None, None
+        return self.percent_k, self.percent_d
+
+class StreamingMACD:
+    """
+    MACD, сигнальная линия и гистограмма, обновляемые по одной цене закрытия за O(1).
+
+    Значения EMA переносятся между обновлениями, поэтому с ростом истории
+    индикатор сходится к «настоящей» EMA, а не к приближению по 36 свечам.
+    """
+    __slots__ = ('_ema_fast', '_ema_slow', '_ema_signal', 'macd', 'signal', 'histogram')
+
+    def __init__(self, fast_period: int = 12, slow_period: int = 26, signal_period: int = 9):
+        self._ema_fast = StreamingEMA(fast_period)
+        self._ema_slow = StreamingEMA(slow_period)
+        self._ema_signal = StreamingEMA(signal_period)
+        self.macd: Optional[float] = None
+        self.signal: Optional[float] = None
+        self.histogram: Optional[float] = None
+
+    def update(self, close: float) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        """
+        Добавляет цену закрытия.
+
+        :return: Текущие значения MACD, сигнальной линии и гистограммы.
+        """
+        fast = self._ema_fast.update(close)
+        slow = self._ema_slow.update(close)
+        if fast is None or slow is None:
+            return None, None, None
+
+        self.macd = fast - slow
+        self.signal = self._ema_signal.update(self.macd)
+        if self.signal is None:
+            # Сигнальная линия ещё не сформирована — как в calculate_macd
+            return None, None, None
+
+        self.histogram = self.macd - self.signal
+        return self.macd, self.signal, self.histogram
+
+class IndicatorState:
+    """
+    Состояние индикаторов для одной пары (символ, интервал).
+    """
+    __slots__ = ('stochastic', 'macd', 'last_start')
+
+    def __init__(self, k_period: int = 14, d_period: int = 3,
+                 fast_period: int = 12, slow_period: int = 26, signal_period: int = 9):
+        self.stochastic = StreamingStochastic(k_period, d_period)
+        self.macd = StreamingMACD(fast_period, slow_period, signal_period)
+        self.last_start: Optional[int] = None
+
+    def update(self, start: int, high: float, low: float, close: float) -> bool:
+        """
+        Добавляет закрытую свечу. Повторно полученные свечи игнорируются.
+
+        :param start: Время открытия свечи (мс).
+        :return: True, если свеча была учтена.
+        """
+        if self.last_start is not None and start <= self.last_start:
+            return False
+        self.last_start = start
+        self.stochastic.update(high, low, close)
+        self.macd.update(close)
+        return True
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        """
+        Возвращает текущие значения индикаторов в формате analyze_candles.
+        """
+        percent_k, percent_d = self.stochastic.percent_k, self.stochastic.percent_d
+        if percent_d is None:
+            percent_k = None
+        macd, signal, histogram = self.macd.macd, self.macd.signal, self.macd.histogram
+        if signal is None:
+            macd = histogram = None
+        return {
+            '%K': percent_k,
+            '%D': percent_d,
+            'MACD': macd,
+            'Signal': signal,
+            'Histogram': histogram,
+        }
+
+class IndicatorRegistry:
+    """
+    Хранилище состояний индикаторов по ключу (символ, интервал).
+    """
+
+    def __init__(self, k_period: int = 14, d_period: int = 3,
+                 fast_period: int = 12, slow_period: int = 26, signal_period: int = 9):
+        self.periods = (k_period, d_period, fast_period, slow_period, signal_period)
+        self.states: Dict[Tuple[str, str], IndicatorState] = {}
+
+    def get(self, symbol: str, interval: str) -> IndicatorState:
+        key = (symbol, interval)
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = IndicatorState(*self.periods)
+        return state
+
+    def reset(self, symbol: str, interval: str) -> IndicatorState:
+        """
+        Заменяет состояние пары пустым (например, после пропуска свечей).
+        """
+        state = self.states[(symbol, interval)] = IndicatorState(*self.periods)
+        return state
+
+    def discard(self, symbol: str, interval: str):
+        self.states.pop((symbol, interval), None)
+
+    def update(self, symbol: str, interval: str, start: int, high: float, low: float, close: float) -> Dict[str, Optional[float]]:
+        """
+        Обновляет состояние пары (символ, интервал) закрытой свечой.
+
+        :return: Текущие значения индикаторов.
+        """
+        state = self.get(symbol, interval)
+        state.update(start, high, low, close)
+        return state.snapshot()
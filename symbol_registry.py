@@ -0,0 +1,135 @@
+# symbol_registry.py
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+import aiohttp
+from bybit_api import get_instruments_info, is_usdt_perpetual
+
+def parse_instrument(instrument: dict) -> dict:
+    """
+    Извлекает метаданные контракта из ответа instruments-info.
+    """
+    price_filter = instrument.get('priceFilter', {})
+    lot_size_filter = instrument.get('lotSizeFilter', {})
+    leverage_filter = instrument.get('leverageFilter', {})
+    return {
+        'symbol': instrument['symbol'],
+        'base_coin': instrument.get('baseCoin'),
+        'launch_time': int(instrument.get('launchTime') or 0),
+        'tick_size': float(price_filter.get('tickSize') or 0),
+        'qty_step': float(lot_size_filter.get('qtyStep') or 0),
+        'min_order_qty': float(lot_size_filter.get('minOrderQty') or 0),
+        'max_leverage': float(leverage_filter.get('maxLeverage') or 0),
+        'funding_interval': int(instrument.get('fundingInterval') or 0),
+    }
+
+class SymbolRegistry:
+    """
+    Кэш USDT бессрочных контрактов с TTL.
+
+    Список сохраняется на диск для быстрого старта и обновляется в фоне,
+    не задерживая цикл анализа.
+    """
+
+    def __init__(self, cache_path: Optional[str] = 'symbols.json', ttl: float = 3600,
+                 logger: Optional[logging.Logger] = None):
+        """
+        :param cache_path: Путь к файлу кэша (None — без сохранения на диск).
+        :param ttl: Время жизни списка, сек.
+        :param logger: Логгер.
+        """
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.logger = logger or logging.getLogger(__name__)
+        self.instruments: Dict[str, dict] = {}
+        self.updated_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.load_cache()
+
+    @property
+    def symbols(self) -> List[str]:
+        return sorted(self.instruments)
+
+    def metadata(self, symbol: str) -> Optional[dict]:
+        """
+        Возвращает метаданные контракта (шаг цены, дата запуска и т.д.).
+        """
+        return self.instruments.get(symbol)
+
+    def is_stale(self) -> bool:
+        return time.time() - self.updated_at > self.ttl
+
+    def load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.instruments = data['instruments']
+            self.updated_at = data['updated_at']
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.warning("Не удалось прочитать кэш символов %s: %s", self.cache_path, e)
+
+    def save_cache(self):
+        if not self.cache_path:
+            return
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'updated_at': self.updated_at, 'instruments': self.instruments}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    async def refresh(self, session: aiohttp.ClientSession) -> bool:
+        """
+        Загружает полный список контрактов и применяет изменения.
+
+        :return: True, если список обновлён.
+        """
+        instruments = await get_instruments_info(session)
+        if not instruments:
+            return False
+
+        fresh = {
+            instrument['symbol']: parse_instrument(instrument)
+            for instrument in instruments if is_usdt_perpetual(instrument)
+        }
+        added = fresh.keys() - self.instruments.keys()
+        removed = self.instruments.keys() - fresh.keys()
+        if self.instruments and (added or removed):
+            self.logger.info("Список символов изменён. Добавлены: %s, удалены: %s", sorted(added), sorted(removed))
+
+        self.instruments = fresh
+        self.updated_at = time.time()
+        try:
+            self.save_cache()
+        except OSError as e:
+            self.logger.warning("Не удалось сохранить кэш символов %s: %s", self.cache_path, e)
+        return True
+
+    def refresh_in_background(self, session: aiohttp.ClientSession):
+        """
+        Запускает обновление в фоне, если оно ещё не выполняется.
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh(session))
+
+    async def get_symbols(self, session: aiohttp.ClientSession) -> List[str]:
+        """
+        Возвращает список символов. Загружает его синхронно только при пустом кэше,
+        устаревший кэш обновляется в фоне.
+        """
+        if not self.instruments:
+            await self.refresh(session)
+        elif self.is_stale():
+            self.refresh_in_background(session)
+        return self.symbols
+
+    async def close(self):
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,214 @@
+# test_bybit_ws.py
+import asyncio
+import json
+import time
+import unittest
+from unittest import mock
+import aiohttp
+from aiohttp import web
+import bybit_api
+from bybit_api import INTERVAL_MS
+from bybit_ws import KlineStream
+
+SYMBOLS = ['AAAUSDT', 'BBBUSDT', 'CCCUSDT']
+INTERVAL = '15'
+INTERVAL_MS_15 = INTERVAL_MS[INTERVAL]
+
+def make_row(start: int, close: float = None) -> list:
+    """
+    Детерминированная свеча в формате REST Bybit.
+    """
+    close = 100 + (start // INTERVAL_MS_15) % 10 if close is None else close
+    return [str(start), str(close - 1), str(close + 1), str(close - 2), str(close), '10', '1000']
+
+class BybitStandIn:
+    """
+    Локальная замена Bybit: WebSocket с подписками на свечи и REST /v5/market/kline.
+    """
+
+    def __init__(self):
+        self.current_start = int(time.time() * 1000) // INTERVAL_MS_15 * INTERVAL_MS_15
+        self.subscriptions = []  # Запросы подписки (списки топиков) по соединениям
+        self.kline_requests = 0
+        self.kline_delay = 0.0
+        self.socket = None
+        self.runner = None
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        batches = []
+        self.subscriptions.append(batches)
+        self.socket = ws
+        async for message in ws:
+            data = json.loads(message.data)
+            if data.get('op') == 'subscribe':
+                batches.append(data['args'])
+                await ws.send_json({'success': True, 'op': 'subscribe', 'ret_msg': ''})
+        return ws
+
+    async def kline(self, request: web.Request) -> web.Response:
+        # Как Bybit: от новых к старым, первая свеча — текущая незакрытая
+        self.kline_requests += 1
+        await asyncio.sleep(self.kline_delay)
+        limit = int(request.query['limit'])
+        rows = [make_row(self.current_start - i * INTERVAL_MS_15) for i in range(limit)]
+        return web.json_response({'retCode': 0, 'retMsg': 'OK', 'result': {'list': rows}})
+
+    async def push(self, symbol: str, row: list, confirm: bool):
+        fields = ('start', 'open', 'high', 'low', 'close', 'volume', 'turnover')
+        item = dict(zip(fields, row), start=int(row[0]), confirm=confirm)
+        await self.socket.send_json({'topic': f"kline.{INTERVAL}.{symbol}", 'data': [item]})
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get('/ws', self.websocket)
+        app.router.add_get('/v5/market/kline', self.kline)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+async def wait_for(predicate, timeout: float = 3.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Условие не выполнено за отведённое время")
+        await asyncio.sleep(0.01)
+
+class KlineStreamTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = BybitStandIn()
+        base = await self.server.start()
+        patcher = mock.patch.object(bybit_api, 'API_BASE_URL', f"{base}/v5/market/")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.session = aiohttp.ClientSession()
+        self.url = f"{base.replace('http', 'ws', 1)}/ws"
+        self.received = []
+        self.streams = []
+        self.stream = self.open_stream()
+        # Дожидаемся подключения и дозагрузки истории через REST
+        await wait_for(lambda: all(len(self.stream.get_candles(symbol, INTERVAL)) == 5 for symbol in SYMBOLS))
+
+    def open_stream(self) -> KlineStream:
+        async def on_candle(symbol, interval, row):
+            self.received.append((symbol, interval, int(row[0]), row[4]))
+
+        stream = KlineStream(self.session, SYMBOLS, [INTERVAL], on_candle=on_candle, url=self.url,
+                             history=5, batch_size=2, ping_interval=60, reconnect_delay=0.05)
+        self.streams.append((stream, asyncio.create_task(stream.run())))
+        return stream
+
+    async def asyncTearDown(self):
+        for stream, task in self.streams:
+            await stream.close()
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.session.close()
+        await self.server.stop()
+
+    def starts(self, symbol: str, stream: KlineStream = None) -> list:
+        return list((stream or self.stream).get_candles(symbol, INTERVAL).start)
+
+    def assert_window(self, starts: list, last: int):
+        self.assertEqual(starts, [last - i * INTERVAL_MS_15 for i in range(4, -1, -1)])
+
+    async def test_subscribes_in_batches(self):
+        await wait_for(lambda: sum(map(len, self.server.subscriptions[0])) == len(SYMBOLS))
+        batches = self.server.subscriptions[0]
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertEqual(sorted(topic for batch in batches for topic in batch), sorted(self.stream.topics()))
+
+    async def test_backfill_on_connect_keeps_only_closed_candles(self):
+        current = self.server.current_start
+        # Последняя свеча REST ещё не закрыта и не сохраняется
+        self.assertEqual(self.starts('AAAUSDT'), [current - i * INTERVAL_MS_15 for i in range(5, 0, -1)])
+
+    async def test_stores_only_confirmed_candles(self):
+        current = self.server.current_start
+        await self.server.push('AAAUSDT', make_row(current, close=999), confirm=False)
+        await self.server.push('AAAUSDT', make_row(current, close=101), confirm=True)
+        await wait_for(lambda: self.starts('AAAUSDT')[-1] == current)
+
+        self.assertEqual(self.stream.get_candles('AAAUSDT', INTERVAL).close[-1], 101)
+        self.assertEqual([item for item in self.received if item[2] == current],
+                         [('AAAUSDT', INTERVAL, current, '101')])
+        self.assertEqual(len(self.starts('AAAUSDT')), 5)
+
+    async def test_backfills_gap_through_rest(self):
+        previous = self.server.current_start
+        requests = self.server.kline_requests
+        # Свеча previous пропущена: стрим должен дозагрузить её через REST
+        self.server.current_start = previous + 2 * INTERVAL_MS_15
+        await self.server.push('BBBUSDT', make_row(previous + INTERVAL_MS_15), confirm=True)
+        await wait_for(lambda: self.starts('BBBUSDT')[-1] == previous + INTERVAL_MS_15)
+
+        starts = self.starts('BBBUSDT')
+        self.assertIn(previous, starts)
+        self.assertEqual(starts, [starts[0] + i * INTERVAL_MS_15 for i in range(len(starts))])
+        self.assertGreater(self.server.kline_requests, requests)
+
+    async def test_resubscribes_after_server_drops_connection(self):
+        await wait_for(lambda: sum(map(len, self.server.subscriptions[0])) == len(SYMBOLS))
+        await self.server.socket.close()
+        await wait_for(lambda: len(self.server.subscriptions) == 2
+                       and sum(map(len, self.server.subscriptions[1])) == len(SYMBOLS))
+        await wait_for(self.stream.connected.is_set)
+
+        batches = self.server.subscriptions[1]
+        self.assertEqual(sorted(topic for batch in batches for topic in batch), sorted(self.stream.topics()))
+
+        # Новые свечи после переподключения снова принимаются
+        current = self.server.current_start
+        await self.server.push('CCCUSDT', make_row(current), confirm=True)
+        await wait_for(lambda: self.starts('CCCUSDT')[-1] == current)
+
+    async def test_live_candle_before_backfill_keeps_history(self):
+        # Дозагрузка при запуске медленнее, чем приход подтверждённой свечи
+        self.server.kline_delay = 0.3
+        current = self.server.current_start
+        stream = self.open_stream()
+        await wait_for(lambda: len(self.server.subscriptions) == 2
+                       and sum(map(len, self.server.subscriptions[1])) == len(SYMBOLS))
+        await self.server.push('AAAUSDT', make_row(current), confirm=True)
+        await wait_for(lambda: self.starts('AAAUSDT', stream) == [current])
+
+        await wait_for(lambda: len(self.starts('AAAUSDT', stream)) == 5)
+        self.assert_window(self.starts('AAAUSDT', stream), current)
+        # Подтверждённая свеча WebSocket не заменяется строкой REST
+        self.assertEqual(stream.get_candles('AAAUSDT', INTERVAL).close[-1], float(make_row(current)[4]))
+
+    async def test_live_candle_before_backfill_of_added_symbol(self):
+        await wait_for(lambda: sum(map(len, self.server.subscriptions[0])) == len(SYMBOLS))
+        self.server.kline_delay = 0.3
+        current = self.server.current_start
+        update = asyncio.create_task(self.stream.update_symbols(SYMBOLS + ['DDDUSDT']))
+        await wait_for(lambda: any('kline.15.DDDUSDT' in batch for batch in self.server.subscriptions[0]))
+        await self.server.push('DDDUSDT', make_row(current), confirm=True)
+        await update
+
+        self.assert_window(self.starts('DDDUSDT'), current)
+        # Свечи старше уже полученной дописываются в историю без повторного вызова обработчика
+        received = [start for symbol, _, start, _ in self.received if symbol == 'DDDUSDT']
+        self.assertEqual(received, [current])
+
+    async def test_keeps_history_per_interval(self):
+        self.stream.history = {INTERVAL: 3}
+        current = self.server.current_start
+        for i in range(4):
+            await self.server.push('AAAUSDT', make_row(current + i * INTERVAL_MS_15), confirm=True)
+        await wait_for(lambda: self.starts('AAAUSDT')[-1] == current + 3 * INTERVAL_MS_15)
+
+        self.assertEqual(self.starts('AAAUSDT'), [current + i * INTERVAL_MS_15 for i in range(1, 4)])
+        self.assertEqual(len(self.stream.get_candles('AAAUSDT', INTERVAL, limit=2)), 2)
+
+if __name__ == '__main__':
+    unittest.main()